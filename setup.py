@@ -70,7 +70,7 @@ setup(
     package_dir={'': 'src'},
     namespace_packages=['zope'],
     install_requires=[
-        'multipart>=1.1.0',
+        'multipart>=1.3',
         'setuptools',
         'zope.browser',
         'zope.component',
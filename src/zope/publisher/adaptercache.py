@@ -0,0 +1,66 @@
+##############################################################################
+#
+# Copyright (c) Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Caches of adapter factory lookups.
+
+The publisher looks up the same adapters, e.g. `IResult` for `str` results,
+for every request.  The caches here remember the factories (or their
+absence) per adapter registry of the current site and forget them as soon
+as one of the registries involved changes.
+"""
+__docformat__ = 'restructuredtext'
+
+import threading
+import weakref
+
+import zope.component
+
+
+class AdapterLookupCache:
+    """Cache of the factories adapting to `provided` (with `name`).
+
+    The factories are cached under a key chosen by the caller, which must
+    determine the specifications the adapter is required for.
+    """
+
+    def __init__(self, provided, name=''):
+        self.provided = provided
+        self.name = name
+        self._lock = threading.Lock()
+        self._registries = weakref.WeakKeyDictionary()
+
+    def lookup(self, key, required, context=None):
+        """Return the factory for the `required` specifications or None.
+
+        The result is cached under `key` for the adapter registry of the
+        site manager of `context`.
+        """
+        registry = zope.component.getSiteManager(context).adapters
+        generations = [r._generation for r in registry.ro]
+        entry = self._registries.get(registry)
+        if entry is None or entry[0] != generations:
+            entry = (generations, {})
+            with self._lock:
+                self._registries[registry] = entry
+
+        factories = entry[1]
+        try:
+            return factories[key]
+        except KeyError:
+            factory = registry.lookup(required, self.provided, self.name)
+            factories[key] = factory
+            return factory
+
+    def clear(self):
+        with self._lock:
+            self._registries.clear()
@@ -0,0 +1,256 @@
+##############################################################################
+#
+# Copyright (c) Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""ASGI integration
+
+Publish requests with the publications used by
+:class:`zope.publisher.paste.Application` behind ASGI 3 servers.
+Publication is synchronous, so every request is published in a bounded
+thread pool while the event loop streams the request and response bodies.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import zope.publisher.http
+import zope.publisher.paste
+
+
+_marker = object()
+
+
+class ReceiveStream:
+    """Blocking, file-like reader of the body messages of an ASGI request.
+
+    The stream is read by the thread publishing the request.  It fetches
+    one ``http.request`` message from the event loop whenever it runs out
+    of data, so the client is read only as fast as the body is consumed.
+    """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = bytearray()
+        self._more = True
+
+    def _fill(self):
+        message = asyncio.run_coroutine_threadsafe(
+            self._receive(), self._loop).result()
+        if message['type'] == 'http.disconnect':
+            self._more = False
+            raise ConnectionError('The client disconnected')
+        self._buffer += message.get('body', b'')
+        self._more = message.get('more_body', False)
+
+    def _take(self, size):
+        buffer = self._buffer
+        if size < 0 or size >= len(buffer):
+            data = bytes(buffer)
+            buffer.clear()
+        else:
+            data = bytes(buffer[:size])
+            del buffer[:size]
+        return data
+
+    def read(self, size=-1):
+        if size is None:
+            size = -1
+        while self._more and (size < 0 or len(self._buffer) < size):
+            self._fill()
+        return self._take(size)
+
+    def readline(self, size=-1):
+        if size is None:
+            size = -1
+        while True:
+            end = self._buffer.find(b'\n') + 1
+            if end or not self._more or 0 <= size <= len(self._buffer):
+                break
+            self._fill()
+        if not end:
+            end = len(self._buffer)
+        if size >= 0:
+            end = min(end, size)
+        return self._take(end)
+
+    def readlines(self, hint=-1):
+        lines = []
+        total = 0
+        while True:
+            line = self.readline()
+            if not line:
+                break
+            lines.append(line)
+            total += len(line)
+            if 0 < hint <= total:
+                break
+        return lines
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+
+def _latin1(text):
+    # WSGI represents decoded bytes as latin-1 strings.
+    return text.encode('utf-8').decode('latin-1')
+
+
+def scope_to_environ(scope, body_stream):
+    """Build a WSGI-style environment from an ASGI HTTP connection scope.
+    """
+    scheme = scope.get('scheme', 'http')
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and (path == root_path
+                      or path.startswith(root_path.rstrip('/') + '/')):
+        # Like in WSGI, the path below the application is the PATH_INFO.
+        path = path[len(root_path.rstrip('/')):]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': _latin1(root_path),
+        'PATH_INFO': _latin1(path),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'wsgi.url_scheme': scheme,
+        'wsgi.input': body_stream,
+    }
+    if scheme == 'https':
+        environ['HTTPS'] = 'on'
+
+    server = scope.get('server')
+    if server:
+        environ['SERVER_NAME'] = server[0]
+        if server[1] is not None:
+            environ['SERVER_PORT'] = str(server[1])
+    client = scope.get('client')
+    if client:
+        environ['REMOTE_ADDR'] = client[0]
+
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        if name in environ:
+            # HTTP/2 sends each cookie in a header of its own (RFC 7540,
+            # section 8.1.2.5), they have to be joined like in HTTP/1.
+            separator = '; ' if name == 'HTTP_COOKIE' else ','
+            value = environ[name] + separator + value
+        environ[name] = value
+    return environ
+
+
+class Application(zope.publisher.paste.Application):
+    """ASGI 3 application publishing requests in a bounded thread pool.
+
+    The constructor takes the same arguments as the WSGI application, and
+    additionally the number of `threads` publishing requests concurrently.
+    """
+
+    def __init__(self, global_config, publication, threads=10, **options):
+        super().__init__(global_config, publication, **options)
+        self.threads = int(threads)
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.threads,
+                thread_name_prefix='zope.publisher.asgi')
+        return self._executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError(
+                'Unsupported ASGI connection type %r' % scope['type'])
+
+        loop = asyncio.get_running_loop()
+        environ = scope_to_environ(scope, ReceiveStream(receive, loop))
+        request = await loop.run_in_executor(
+            self.executor, self._publish, environ)
+        response = request.response
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.getStatus(),
+            'headers': [(name.encode('latin-1'), value.encode('latin-1'))
+                        for name, value in response.getHeaders()],
+        })
+        body = response.consumeBodyIter()
+        if (isinstance(body, zope.publisher.http.FileResult)
+                and 'http.response.zerocopysend' in scope.get(
+                    'extensions', {})):
+            await self._sendFile(loop, body, send)
+        else:
+            await self._sendBody(loop, body, send)
+
+    async def _sendFile(self, loop, body, send):
+        # Let the server send the file with the zero copy send extension,
+        # unless it is not a real file (e.g. BytesIO).
+        try:
+            body.file.fileno()
+        except (AttributeError, OSError):
+            await self._sendBody(loop, body, send)
+            return
+        try:
+            await send({'type': 'http.response.zerocopysend',
+                        'file': body.file,
+                        'offset': body.offset,
+                        'count': body.length})
+        finally:
+            body.close()
+
+    async def _sendBody(self, loop, body, send):
+        try:
+            if isinstance(body, (list, tuple)):
+                # Already in memory, no need to bother the thread pool.
+                for chunk in body:
+                    await self._sendChunk(chunk, send)
+            else:
+                # Iterating may block (e.g. reading files), do it in a
+                # thread and hand the chunks to the server one by one.
+                iterator = iter(body)
+                while True:
+                    chunk = await loop.run_in_executor(
+                        self.executor, next, iterator, _marker)
+                    if chunk is _marker:
+                        break
+                    await self._sendChunk(chunk, send)
+        finally:
+            close = getattr(body, 'close', None)
+            if close is not None:
+                close()
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def _sendChunk(self, chunk, send):
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        if chunk:
+            await send({'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._executor is not None:
+                    self._executor.shutdown(wait=True)
+                    self._executor = None
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
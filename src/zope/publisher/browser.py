@@ -18,13 +18,16 @@ big improvement of the 'BrowserRequest' to 'HTTPRequest' is that is can handle
 HTML form data and convert them into a Python-native format. Even file data is
 packaged into a nice, Python-friendly 'FileUpload' object.
 """
+import functools
 import re
 import tempfile
 from email.message import Message
+from io import BytesIO
 from urllib.parse import parse_qsl
 
 import multipart
 import zope.component
+import zope.contenttype.parse
 import zope.interface
 from zope.i18n.interfaces import IModifiableUserPreferredLanguages
 from zope.i18n.interfaces import IUserPreferredCharsets
@@ -35,6 +38,7 @@ from zope.location import Location
 
 from zope.publisher.http import HTTPRequest
 from zope.publisher.http import HTTPResponse
+from zope.publisher.http import getCharsetsUsingRequest
 from zope.publisher.http import getCharsetUsingRequest
 # BBB imports, these components got moved from this module
 from zope.publisher.interfaces import IHeld
@@ -57,11 +61,15 @@ __ArrayTypes = (list, tuple)
 
 start_of_header_search = re.compile(b'(<head[^>]*>)', re.I).search
 base_re_search = re.compile(b'(<base.*?>)', re.I).search
+end_of_header_search = re.compile(b'</head\\s*>|<body', re.I).search
 isRelative = re.compile("[-_.!~*a-zA-z0-9'()@&=+$,]+(/|$)").match
 newlines = re.compile('\r\n|\n\r|\r')
 
 MULIPART_PART_LIMIT = 1024
 
+# How many bytes of a streamed page are searched for its <head>.
+HEAD_SEARCH_LIMIT = 4096
+
 
 def is_text_html(content_type):
     return content_type.startswith('text/html')
@@ -177,6 +185,63 @@ def registerTypeConverter(field_type, converter, replace=False):
         raise KeyError('Existing converter for field_type: %s' % field_type)
 
     type_converters[field_type] = converter
+    _key_plan.cache_clear()
+
+
+@functools.lru_cache(maxsize=4096)
+def _key_plan(key, type_format):
+    """Parse the ``:type`` suffixes of the form field name `key`.
+
+    Return the name without the suffixes, the flags, the converter and the
+    steps depending on the field value or the request, which are applied
+    in order by `BrowserRequest.__processItem`.  Forms are submitted with
+    the same names again and again, so the plans are cached.
+    """
+    flags = 0
+    converter = None
+    steps = []
+
+    # We'll search from the back to the front.
+    # We'll do the search in two steps.  First, we'll
+    # do a string search, and then we'll check it with
+    # a re search.
+
+    while key:
+        pos = key.rfind(":")
+        if pos < 0:
+            break
+        match = type_format.match(key, pos + 1)
+        if match is None:
+            break
+
+        key, type_name = key[:pos], key[pos + 1:]
+
+        # find the right type converter
+        c = get_converter(type_name, None)
+
+        if c is not None:
+            converter = c
+            flags |= CONVERTED
+        elif type_name == 'list':
+            flags |= SEQUENCE
+        elif type_name == 'tuple':
+            steps.append(('tuple', key))
+            flags |= SEQUENCE
+        elif (type_name == 'method' or type_name == 'action'):
+            steps.append(('method', key))
+        elif (type_name == 'default_method'
+                or type_name == 'default_action'):
+            steps.append(('default_method', key))
+        elif type_name == 'default':
+            flags |= DEFAULT
+        elif type_name == 'record':
+            flags |= RECORD
+        elif type_name == 'records':
+            flags |= RECORDS
+        elif type_name == 'ignore_empty':
+            steps.append(('ignore_empty', key))
+
+    return key, flags, converter, tuple(steps)
 
 
 def isCGI_NAME(key):
@@ -239,12 +304,34 @@ class Record:
 _get_or_head = 'GET', 'HEAD'
 
 
+class _SpooledPart:
+    """A part of a multipart/form-data body, see FileUpload."""
+
+    def __init__(self, segment, charset, spool_limit):
+        self.name = segment.name
+        self.filename = segment.filename
+        self.headers = multipart.Headers(segment.headerlist)
+        self.charset = segment.charset or charset
+        if not self.filename:
+            # Form fields end up in memory anyway.
+            self.file = BytesIO()
+        elif spool_limit > 0:
+            self.file = tempfile.SpooledTemporaryFile(max_size=spool_limit)
+        else:
+            self.file = tempfile.TemporaryFile()
+
+    @property
+    def value(self):
+        return self.file.getvalue().decode(self.charset)
+
+
 @implementer(IBrowserRequest, IBrowserApplicationRequest)
 class BrowserRequest(HTTPRequest):
 
     __slots__ = (
         '__provides__',  # Allow request to directly provide interfaces
-        'form',  # Form data
+        '_form',  # Form data
+        '__form_pending',
         'charsets',  # helper attribute
         '__meth',
         '__tuple_items',
@@ -258,20 +345,56 @@ class BrowserRequest(HTTPRequest):
 
     default_form_charset = 'UTF-8'
 
+    # Set this to True to process multipart/form-data bodies part by part
+    # as they are read instead of parsing the whole body first.  Parts
+    # can then be streamed elsewhere, see getUploadSink.  The body is
+    # still cached for retries unless retry_max_count is 0.
+    incremental_multipart = False
+
+    # Uploaded files up to this size are kept in memory.
+    multipart_spool_limit = 0
+
+    # The form fields of an incrementally parsed multipart body may use up
+    # to this many bytes in total, like the memory_limit of multipart.
+    multipart_memory_limit = 1024 * 64 * 128
+
+    # Set this to True to process the form data when `form` (or `get` or
+    # `keys`) is first used rather than in processInputs.  Requests which
+    # never look at their form then don't pay for parsing it.  Only a
+    # ``:method`` or ``:action`` in the query string of GET and HEAD
+    # requests is still found before traversal; such markers in a request
+    # body are ignored.
+    lazy_form = False
+
     def __init__(self, body_instream, environ, response=None):
-        self.form = {}
+        self._form = {}
+        self.__form_pending = False
         self.charsets = None
         super().__init__(body_instream, environ, response)
 
+    def _getForm(self):
+        if self.__form_pending:
+            self.__form_pending = False
+            self.__processInputs(set_path_suffix=False)
+        return self._form
+
+    def _setForm(self, form):
+        self.__form_pending = False
+        self._form = form
+
+    form = property(_getForm, _setForm)
+
     def _createResponse(self):
         return BrowserResponse()
 
     def _decode(self, text):
         """Try to decode the text using one of the available charsets."""
         if self.charsets is None:
-            envadapter = IUserPreferredCharsets(self)
-            self.charsets = envadapter.getPreferredCharsets() or ['utf-8']
-            self.charsets = [c for c in self.charsets if c != '*']
+            charsets = getCharsetsUsingRequest(self)
+            if charsets is None:
+                raise TypeError('Could not adapt', self,
+                                IUserPreferredCharsets)
+            self.charsets = [c for c in charsets or ['utf-8'] if c != '*']
         # All text comes from parse_qsl or multipart.parse_form_data, and
         # has normally already been decoded into Unicode according to a
         # request-specified encoding.  However, in the case of query strings
@@ -290,27 +413,48 @@ class BrowserRequest(HTTPRequest):
 
     def processInputs(self):
         'See IPublisherRequest'
-        items = []
-
         # We could simply not parse QUERY_STRING if it's absent, but this
         # provides slightly better doctest-compatibility with the old code
         # based on cgi.FieldStorage.
         self._environ.setdefault('QUERY_STRING', '')
 
+        if self.lazy_form:
+            self.__form_pending = True
+            if self.method in _get_or_head:
+                meth = self.__scanMethod(self.__queryItems())
+                if meth:
+                    self.setPathSuffix((meth,))
+        else:
+            self.__processInputs()
+
+    def __queryItems(self):
+        # For now, use an encoding that can decode any byte
+        # sequence.  We'll do some guesswork later.
+        query_items = parse_qsl(
+            self._environ['QUERY_STRING'], keep_blank_values=True,
+            encoding='ISO-8859-1', errors='replace')
+        # Encode back to bytes for later guessing.
+        return [(key, value.encode('ISO-8859-1'))
+                for key, value in query_items]
+
+    def __scanMethod(self, items):
+        # Find the path suffix the ``:method`` and ``:action`` markers
+        # select, as __processItem does.
+        meth = None
+        for key, item in items:
+            for step, name in _key_plan(key, self._typeFormat)[3]:
+                if step == 'method':
+                    meth = name or item
+                elif step == 'default_method' and not meth:
+                    meth = name or item
+                elif step == 'ignore_empty' and not item:
+                    break
+        return meth
+
+    def __processInputs(self, set_path_suffix=True):
         if self.method in _get_or_head:
-            kwargs = {}
-            # For now, use an encoding that can decode any byte
-            # sequence.  We'll do some guesswork later.
-            kwargs['encoding'] = 'ISO-8859-1'
-            kwargs['errors'] = 'replace'
-            query_items = parse_qsl(
-                self._environ['QUERY_STRING'], keep_blank_values=True,
-                **kwargs)
-            for key, value in query_items:
-                # Encode back to bytes for later guessing.
-                value = value.encode('ISO-8859-1')
-                items.append((key, value))
-        elif self.method not in _get_or_head:
+            items = self.__queryItems()
+        else:
             env = self._environ.copy()
             env['wsgi.input'] = self._body_instream
             # cgi.FieldStorage used to set the default Content-Type for POST
@@ -342,109 +486,161 @@ class BrowserRequest(HTTPRequest):
             # value according to RFC 2616 (HTTP/1.1).
             if env.get('CONTENT_LENGTH') == '':
                 env.pop('CONTENT_LENGTH')
-            forms, files = multipart.parse_form_data(
-                env, charset=self.default_form_charset,
-                part_limit=MULIPART_PART_LIMIT, spool_limit=0)
-            items.extend(forms.iterallitems())
-            for key, item in files.iterallitems():
-                # multipart puts fields in 'files' even if no upload was
-                # made.  We only consider fields to be file uploads if a
-                # filename was passed in and data was uploaded.
-                if item.file:
-                    if item.filename:
-                        # RFC 7578 section 4.2 says:
-                        #   Some commonly deployed systems use
-                        #   multipart/form-data with file names directly
-                        #   encoded including octets outside the US-ASCII
-                        #   range.  The encoding used for the file names is
-                        #   typically UTF-8, although HTML forms will use
-                        #   the charset associated with the form.
-                        # So we must decode the filename according to our
-                        # usual rules.
-                        item.filename = self._decode(item.filename)
-                        item = FileUpload(item)
-                    else:
-                        value = item.value
-                        item.file.close()
-                        item = value
-                else:
-                    item = item.value
-                self.hold(item)
-                items.append((key, item))
-
-        if items:
-            self.__meth = None
-            self.__tuple_items = {}
-            self.__defaults = {}
-
-            # process all entries in the field storage (form)
-            for key, item in items:
-                self.__processItem(key, item)
 
-            if self.__defaults:
-                self.__insertDefaults()
-
-            if self.__tuple_items:
-                self.__convertToTuples()
-
-            if self.__meth:
-                self.setPathSuffix((self.__meth,))
+            if (self.incremental_multipart
+                    and msg.get_content_type() == 'multipart/form-data'):
+                items = self.__iterMultipartItems(env, msg)
+            else:
+                items = self.__parseFormData(env)
+
+        self.__meth = None
+        self.__tuple_items = {}
+        self.__defaults = {}
+
+        # process all entries in the field storage (form)
+        for key, item in items:
+            self.__processItem(key, item)
+
+        if self.__defaults:
+            self.__insertDefaults()
+
+        if self.__tuple_items:
+            self.__convertToTuples()
+
+        if self.__meth and set_path_suffix:
+            self.setPathSuffix((self.__meth,))
+
+    def __parseFormData(self, env):
+        forms, files = multipart.parse_form_data(
+            env, charset=self.default_form_charset,
+            part_limit=MULIPART_PART_LIMIT,
+            spool_limit=self.multipart_spool_limit)
+        items = list(forms.iterallitems())
+        for key, item in files.iterallitems():
+            # multipart puts fields in 'files' even if no upload was
+            # made.  We only consider fields to be file uploads if a
+            # filename was passed in and data was uploaded.
+            if item.file:
+                if item.filename:
+                    item = self.__fileUpload(item)
+                else:
+                    value = item.value
+                    item.file.close()
+                    item = value
+            else:
+                item = item.value
+            self.hold(item)
+            items.append((key, item))
+        return items
+
+    def __fileUpload(self, item):
+        # RFC 7578 section 4.2 says:
+        #   Some commonly deployed systems use multipart/form-data with
+        #   file names directly encoded including octets outside the
+        #   US-ASCII range.  The encoding used for the file names is
+        #   typically UTF-8, although HTML forms will use the charset
+        #   associated with the form.
+        # So we must decode the filename according to our usual rules.
+        item.filename = self._decode(item.filename)
+        return FileUpload(item)
+
+    def __iterMultipartItems(self, env, msg):
+        # Parse the multipart/form-data body part by part, yielding the
+        # items as soon as their part is complete.
+        charset = msg.get_param('charset') or self.default_form_charset
+        segment = part = sink = None
+        try:
+            try:
+                content_length = int(env.get('CONTENT_LENGTH', -1))
+            except ValueError:
+                raise multipart.ParserError('Invalid Content-Length header')
+            parser = multipart.PushMultipartParser(
+                msg.get_param('boundary') or '',
+                content_length=content_length,
+                max_segment_count=MULIPART_PART_LIMIT,
+                header_charset=charset)
+            memory = 0
+            with parser:
+                for event in parser.parse_blocking(
+                        self._body_instream.read, 1 << 16):
+                    if isinstance(event, multipart.MultipartSegment):
+                        segment = event
+                        sink = self.getUploadSink(
+                            segment.name, segment.filename,
+                            segment.headerlist)
+                        if sink is None:
+                            part = _SpooledPart(
+                                segment, charset, self.multipart_spool_limit)
+                            sink = part.file
+                    elif event:
+                        if part is not None and not part.filename:
+                            memory += len(event)
+                            if memory > self.multipart_memory_limit:
+                                raise multipart.ParserError(
+                                    'Memory limit reached.')
+                        sink.write(event)
+                    else:
+                        if part is None:
+                            item = sink
+                        elif part.filename:
+                            part.file.seek(0)
+                            item = self.__fileUpload(part)
+                        else:
+                            item = part.value
+                        self.hold(item)
+                        name = segment.name
+                        segment = part = sink = None
+                        yield name, item
+        except multipart.MultipartError:
+            # Like multipart.parse_form_data, keep what was parsed
+            # before the body turned out to be malformed.
+            pass
+        finally:
+            # Discard the part that was being parsed when an error
+            # occurred.
+            if part is not None:
+                part.file.close()
+            elif sink is not None:
+                abort = getattr(sink, 'abort', None)
+                if abort is None:
+                    abort = getattr(sink, 'close', None)
+                if abort is not None:
+                    abort()
+
+    def getUploadSink(self, name, filename, headers):
+        """Return a writable object for the body of a multipart part.
+
+        This is only used in `incremental_multipart` mode.  The part body
+        is written to the returned object, e.g. straight into blob
+        storage, which becomes the form value.  Return None to spool the
+        part to a temporary file as usual.
+
+        If the part is incomplete because the body turned out to be
+        malformed, the ``abort`` method of the sink is called, or its
+        ``close`` method if it has none.
+
+        Unless `retry_max_count` is 0, the request body is also cached
+        (and spilled to a temporary file once it is large) so that the
+        request can be retried.  A retried request writes its parts to
+        new sinks.
+        """
+        return None
 
     _typeFormat = re.compile('([a-zA-Z][a-zA-Z0-9_]+|\\.[xy])$')
 
     def __processItem(self, key, item):
         """Process item in the field storage."""
-        flags = 0
-        converter = None
-
-        # Loop through the different types and set
-        # the appropriate flags
         # Syntax: var_name:type_name
-
-        # We'll search from the back to the front.
-        # We'll do the search in two steps.  First, we'll
-        # do a string search, and then we'll check it with
-        # a re search.
-
-        while key:
-            pos = key.rfind(":")
-            if pos < 0:
-                break
-            match = self._typeFormat.match(key, pos + 1)
-            if match is None:
-                break
-
-            key, type_name = key[:pos], key[pos + 1:]
-
-            # find the right type converter
-            c = get_converter(type_name, None)
-
-            if c is not None:
-                converter = c
-                flags |= CONVERTED
-            elif type_name == 'list':
-                flags |= SEQUENCE
-            elif type_name == 'tuple':
-                self.__tuple_items[key] = 1
-                flags |= SEQUENCE
-            elif (type_name == 'method' or type_name == 'action'):
-                if key:
-                    self.__meth = key
-                else:
-                    self.__meth = item
-            elif (type_name == 'default_method'
-                    or type_name == 'default_action') and not self.__meth:
-                if key:
-                    self.__meth = key
-                else:
-                    self.__meth = item
-            elif type_name == 'default':
-                flags |= DEFAULT
-            elif type_name == 'record':
-                flags |= RECORD
-            elif type_name == 'records':
-                flags |= RECORDS
-            elif type_name == 'ignore_empty' and not item:
+        key, flags, converter, steps = _key_plan(key, self._typeFormat)
+        for step, name in steps:
+            if step == 'tuple':
+                self.__tuple_items[name] = 1
+            elif step == 'method':
+                self.__meth = name or item
+            elif step == 'default_method':
+                if not self.__meth:
+                    self.__meth = name or item
+            elif not item:
                 # skip over empty fields
                 return
 
@@ -756,7 +952,7 @@ class BrowserResponse(HTTPResponse):
         '_base',  # The base href
     )
 
-    def _implicitResult(self, body):
+    def __guessContentType(self, body):
         content_type = self.getHeader('content-type')
         if content_type is None and self._status != 304:
             if isHTML(body):
@@ -766,6 +962,8 @@ class BrowserResponse(HTTPResponse):
             self.setHeader('x-content-type-warning', 'guessed from content')
             self.setHeader('content-type', content_type)
 
+    def _implicitResult(self, body):
+        self.__guessContentType(body)
         body, headers = super()._implicitResult(body)
         body = self.__insertBase(body)
         # Update the Content-Length header to account for the inserted
@@ -777,13 +975,65 @@ class BrowserResponse(HTTPResponse):
         headers.append(('content-length', str(len(body))))
         return body, headers
 
-    def __insertBase(self, body):
+    def _streamingHeaders(self, first):
+        # Guess the content type from the first chunk.
+        self.__guessContentType(first)
+        return super()._streamingHeaders(first)
+
+    def _streamingResult(self, result):
+        chunks = super()._streamingResult(result)
+        content_type = self.getHeader('content-type', '')
+        if not self.getBase() or (
+                content_type and not is_text_html(content_type)):
+            return chunks
+        # Most chunks are generated after the request was closed, so the
+        # base tag is encoded now, in the charset the chunks are sent in.
+        params = zope.contenttype.parse.parse(content_type)[2] \
+            if content_type else {}
+        base = self.getBase()
+        if not isinstance(base, bytes):
+            try:
+                base = base.encode(params.get('charset', 'utf-8'))
+            except (LookupError, UnicodeEncodeError):
+                base = base.encode('utf-8')
+        return self.__insertStreamingBase(chunks, base)
+
+    def __insertStreamingBase(self, chunks, base):
+        # Hold the chunks back until the end of the head was seen, so that
+        # an existing <base> tag is found even if the head is split into
+        # several chunks.  Pages without a head near their start are sent
+        # right away.
+        held = []
+        head = False
+        try:
+            for chunk in chunks:
+                held.append(chunk)
+                if head:
+                    data = chunk
+                else:
+                    data = b''.join(held)
+                    if start_of_header_search(data) is None:
+                        if (len(data) > HEAD_SEARCH_LIMIT
+                                or end_of_header_search(data) is not None):
+                            break
+                        continue
+                    head = True
+                if end_of_header_search(data) is not None:
+                    break
+            yield self.__insertBase(b''.join(held), base)
+            yield from chunks
+        finally:
+            chunks.close()
+
+    def __insertBase(self, body, base=None):
         # Only insert a base tag if content appears to be html.
         content_type = self.getHeader('content-type', '')
         if content_type and not is_text_html(content_type):
             return body
 
-        if self.getBase():
+        if base is None:
+            base = self.getBase()
+        if base:
             if body:
                 match = start_of_header_search(body)
                 if match is not None:
@@ -791,11 +1041,10 @@ class BrowserResponse(HTTPResponse):
                     ibase = base_re_search(body)
                     if ibase is None:
                         # Make sure the base URL is not a unicode string.
-                        base = self.getBase()
                         if not isinstance(base, bytes):
                             encoding = getCharsetUsingRequest(
                                 self._request) or 'utf-8'
-                            base = self.getBase().encode(encoding)
+                            base = base.encode(encoding)
                         body = b''.join([body[:index],
                                          b'\n<base href="',
                                          base,
@@ -870,48 +1119,59 @@ class BrowserLanguages:
 
     def getPreferredLanguages(self):
         '''See interface IUserPreferredLanguages'''
-        accept_langs = self.request.get('HTTP_ACCEPT_LANGUAGE', '').split(',')
-
-        # Normalize lang strings
-        accept_langs = [normalize_lang(lang) for lang in accept_langs]
-        # Then filter out empty ones
-        accept_langs = [lang for lang in accept_langs if lang]
-
-        accepts = []
-        for index, lang in enumerate(accept_langs):
-            lang = lang.split(';', 2)
-
-            # If not supplied, quality defaults to 1...
-            quality = 1.0
-
-            if len(lang) == 2:
-                q = lang[1]
-                if q.startswith('q='):
-                    q = q.split('=', 2)[1]
-                    try:
-                        quality = float(q)
-                    except ValueError:
-                        # malformed quality value, skip it.
-                        continue
+        return _parse_accept_language(
+            self.request.get('HTTP_ACCEPT_LANGUAGE', ''))
+
+
+@functools.lru_cache(maxsize=256)
+def _parse_accept_language(header):
+    """Return the languages an Accept-Language header value prefers.
+
+    The header values sent by browsers are few, so the results are cached
+    and shared as tuples.
+    """
+    accept_langs = header.split(',')
+
+    # Normalize lang strings
+    accept_langs = [normalize_lang(lang) for lang in accept_langs]
+    # Then filter out empty ones
+    accept_langs = [lang for lang in accept_langs if lang]
+
+    accepts = []
+    for index, lang in enumerate(accept_langs):
+        lang = lang.split(';', 2)
+
+        # If not supplied, quality defaults to 1...
+        quality = 1.0
+
+        if len(lang) == 2:
+            q = lang[1]
+            if q.startswith('q='):
+                q = q.split('=', 2)[1]
+                try:
+                    quality = float(q)
+                except ValueError:
+                    # malformed quality value, skip it.
+                    continue
 
-            if quality == 1.0:
-                # ... but we use 1.9 - 0.001 * position to
-                # keep the ordering between all items with
-                # 1.0 quality, which may include items with no quality
-                # defined, and items with quality defined as 1.
-                quality = 1.9 - (0.001 * index)
+        if quality == 1.0:
+            # ... but we use 1.9 - 0.001 * position to
+            # keep the ordering between all items with
+            # 1.0 quality, which may include items with no quality
+            # defined, and items with quality defined as 1.
+            quality = 1.9 - (0.001 * index)
 
-            accepts.append((quality, lang[0]))
+        accepts.append((quality, lang[0]))
 
-        # Filter langs with q=0, which means
-        # unwanted lang according to the spec
-        # See: http://www.w3.org/Protocols/rfc2616/rfc2616-sec14.html#sec14.4
-        accepts = [acc for acc in accepts if acc[0]]
+    # Filter langs with q=0, which means
+    # unwanted lang according to the spec
+    # See: http://www.w3.org/Protocols/rfc2616/rfc2616-sec14.html#sec14.4
+    accepts = [acc for acc in accepts if acc[0]]
 
-        accepts.sort()
-        accepts.reverse()
+    accepts.sort()
+    accepts.reverse()
 
-        return [lang for quality, lang in accepts]
+    return tuple(lang for quality, lang in accepts)
 
 
 class NotCompatibleAdapterError(Exception):
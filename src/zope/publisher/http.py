@@ -14,12 +14,25 @@
 """HTTP Publisher
 """
 import base64
+import codecs
+import copy
+import functools
 import http.cookies as cookies
+import io
+import itertools
 import logging
+import os
+import random
 import re
+import string
 import tempfile
+import threading
+import time
+from datetime import datetime
+from datetime import timezone
+from email.utils import formatdate
+from email.utils import parsedate_to_datetime
 from html import escape
-from io import BytesIO
 from urllib.parse import quote
 from urllib.parse import urlsplit
 
@@ -31,12 +44,16 @@ from zope.i18n.interfaces import IUserPreferredCharsets
 from zope.i18n.interfaces import IUserPreferredLanguages
 from zope.i18n.locales import LoadLocaleError
 from zope.i18n.locales import locales
+from zope.interface import implementedBy
+from zope.interface import providedBy
 
+from zope.publisher.adaptercache import AdapterLookupCache
 from zope.publisher.base import BaseRequest
 from zope.publisher.base import BaseResponse
 from zope.publisher.base import RequestDataGetter
 from zope.publisher.base import RequestDataMapper
 from zope.publisher.base import RequestDataProperty
+from zope.publisher.interfaces import BadRequest
 from zope.publisher.interfaces import ISkinnable
 from zope.publisher.interfaces import Redirect
 from zope.publisher.interfaces.http import IHTTPApplicationRequest
@@ -99,16 +116,25 @@ def splitport(host):
     return host, port or None
 
 
+_marker = object()
+
+
 def sane_environment(env):
     # return an environment mapping which has been cleaned of
     # funny business such as REDIRECT_ prefixes added by Apache
     # or HTTP_CGI_AUTHORIZATION hacks.
     # It also makes sure PATH_INFO is a string.
-    dict = {}
-    for key, val in env.items():
-        while key.startswith('REDIRECT_'):
-            key = key[9:]
-        dict[key] = val
+    # Searching the joined keys is much faster than checking each key
+    # and only has false positives, which take the slow path.
+    if 'REDIRECT_' in ' '.join(env):
+        dict = {}
+        for key, val in env.items():
+            while key.startswith('REDIRECT_'):
+                key = key[9:]
+            dict[key] = val
+    else:
+        # Most environments have no redirects, copy them in one go.
+        dict = {**env}
     if 'HTTP_CGI_AUTHORIZATION' in dict:
         dict['HTTP_AUTHORIZATION'] = dict.pop('HTTP_CGI_AUTHORIZATION')
     if 'PATH_INFO' in dict:
@@ -119,6 +145,152 @@ def sane_environment(env):
     return dict
 
 
+_cookie_key_chars = frozenset(
+    string.ascii_letters + string.digits + "!#%&'*+-.^_`|~:")
+_cookie_value_chars = _cookie_key_chars.union("<>@,/()?{}=[]")
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_cookie_header(text):
+    """Parse a Cookie header into a mapping of (UTF-8 decoded) names to values.
+
+    Headers consisting of plain ``name=value`` pairs are split directly;
+    anything else (quoting, attributes like ``path``, ``$`` names) is left to
+    `http.cookies.SimpleCookie`.  A `http.cookies.CookieError` is raised for
+    illegal cookies.  The results are cached by header, so callers must not
+    modify them.
+    """
+    result = {}
+    parts = text.split(';')
+    if not parts[-1].strip():
+        del parts[-1]
+    for part in parts:
+        key, sep, value = part.partition('=')
+        key = key.strip()
+        value = value.strip()
+        if (not sep or not key
+                or not _cookie_key_chars.issuperset(key)
+                or not _cookie_value_chars.issuperset(value)
+                or key.lower() in cookies.Morsel._reserved):
+            break
+        result[key] = value
+    else:
+        return result
+
+    result = {}
+    for k, v in cookies.SimpleCookie(text).items():
+        # recode cookie value to ENCODING (UTF-8)
+        if not isinstance(k, bytes):
+            k = k.encode('latin1')
+        rk = k.decode(ENCODING)
+        v = v.value
+        if not isinstance(v, bytes):
+            v = v.encode('latin1')
+        rv = v.decode(ENCODING)
+        result[rk] = rv
+    return result
+
+
+# Result types HTTPResponse.setResult() handles itself unless an IResult
+# adapter is registered for them.
+_implicit_result_types = frozenset((str, bytes, type(None)))
+_result_adapters = AdapterLookupCache(IResult)
+
+
+@functools.lru_cache(maxsize=256)
+def _canonical_header_name(name):
+    if name.lower() == name:
+        # only change non-literal header names
+        return '-'.join([k.capitalize() for k in name.split('-')])
+    return name
+
+
+def _is_legal_cookie_token(text):
+    return _cookie_key_chars.issuperset(text) and text.isascii()
+
+
+def _set_cookie_value(name, attrs):
+    # Write the value of the Set-Cookie header for the cookie `name` like
+    # http.cookies.Morsel.OutputString() would.  Return None for cookies
+    # which need quoting or escaping, those are left to SimpleCookie.
+    value = attrs['value']
+    if (not value or not name or not isinstance(value, str)
+            or not _is_legal_cookie_token(name)
+            or not _is_legal_cookie_token(value)
+            or name.lower() in cookies.Morsel._reserved):
+        return None
+
+    items = []
+    for k, v in attrs.items():
+        if k == 'value':
+            continue
+        if k == 'secure':
+            if v:
+                items.append(('secure', True))
+            continue
+        if k == 'max_age':
+            k = 'max-age'
+        elif k == 'comment' or k not in cookies.Morsel._reserved:
+            return None
+        v = str(v)
+        if v:
+            items.append((k, v))
+
+    result = [f'{name}={value}']
+    for k, v in sorted(items):
+        if k in cookies.Morsel._flags:
+            result.append(cookies.Morsel._reserved[k])
+        else:
+            result.append(f'{cookies.Morsel._reserved[k]}={v}')
+    return '; '.join(result)
+
+
+def _simple_cookie_value(name, attrs):
+    c = cookies.SimpleCookie()
+    # The Cookie module expects latin-1 unicode string.
+    cookieval = attrs['value'].encode(ENCODING)
+    c[name] = cookieval.decode('latin-1')
+
+    for k, v in attrs.items():
+        if k == 'value':
+            continue
+        if k == 'secure':
+            if v:
+                c[name]['secure'] = True
+            continue
+        if k == 'max_age':
+            k = 'max-age'
+        elif k == 'comment':
+            # Encode rather than throw an exception
+            v = quote(v.encode('utf-8'), safe="/?:@&+")
+        c[name][k] = str(v)
+    return c[name].OutputString()
+
+
+@functools.lru_cache(maxsize=4096)
+def _quote_name(name):
+    # See: http://www.ietf.org/rfc/rfc2718.txt, Section 2.2.5
+    return quote(name.encode("utf-8"), safe='/+@')
+
+
+@functools.lru_cache(maxsize=256)
+def _locale_for_languages(langs):
+    # Return the locale for the first of the preferred languages `langs`
+    # that has one.  Browsers send the same few language preferences
+    # over and over, so the result is cached.
+    for httplang in langs:
+        parts = (httplang.split('-') + [None, None])[:3]
+        try:
+            return locales.getLocale(*parts)
+        except LoadLocaleError:
+            # Just try the next combination
+            pass
+
+    # No combination gave us an existing locale, so use the default,
+    # which is guaranteed to exist
+    return locales.getLocale(None, None, None)
+
+
 @zope.interface.implementer(IHTTPVirtualHostChangedEvent)
 class HTTPVirtualHostChangedEvent:
 
@@ -232,32 +404,101 @@ class URLGetter:
 class HTTPInputStream:
     """Special stream that supports caching the read data.
 
-    This is important, so that we can retry requests.
+    This is important, so that we can retry requests.  The cached data is
+    kept in memory until it grows beyond `spool_threshold` bytes and is
+    spilled to a temporary file after that, whatever length the client
+    advertised.  Bodies that are announced to be larger than the threshold
+    go to a temporary file right away.  Nothing is cached if `cache` is
+    false, e.g. because the request can't be retried anyway.  Then
+    `getCacheStream` only returns the rest of the body which was not read
+    yet.
+
+    The cache is closed by `close`, unless it was handed out by
+    `getCacheStream`.  The stream is only closed if `closeStream` is set,
+    like for the cache of a request that was retried.
     """
 
-    def __init__(self, stream, environment):
+    spool_threshold = 65536
+    closeStream = False
+    _handedOut = False
+
+    def __init__(self, stream, environment, cache=True):
         self.stream = stream
         size = environment.get('CONTENT_LENGTH')
         # There can be no size in the environment (None) or the size
         # can be an empty string, in which case we treat it as absent.
         if not size:
             size = environment.get('HTTP_CONTENT_LENGTH')
-        if not size or int(size) < 65536:
-            self.cacheStream = BytesIO()
-        else:
-            self.cacheStream = tempfile.TemporaryFile()
         self.size = size and int(size) or -1
+        if not cache:
+            self.cacheStream = None
+        elif self.size >= self.spool_threshold:
+            self.cacheStream = tempfile.TemporaryFile()
+        else:
+            self.cacheStream = io.BytesIO()
+        self._consumed = 0
 
     def getCacheStream(self):
-        self.read(self.size)
+        if self.cacheStream is None:
+            # Cache what is left of the body.
+            self.cacheStream = io.BytesIO()
+        if self.size < 0:
+            self.read(self.size)
+        else:
+            self._drain(self.size - self._consumed)
         self.cacheStream.seek(0)
+        self._handedOut = True
         return self.cacheStream
 
+    def close(self):
+        """Close the cache and, if `closeStream` is set, the stream."""
+        if self.cacheStream is not None and not self._handedOut:
+            self.cacheStream.close()
+        if self.closeStream:
+            self.stream.close()
+
+    def _drain(self, remaining):
+        # Read the rest of the body into the cache without creating a
+        # bytes object per chunk.
+        buffer = bytearray(min(remaining, 65536))
+        while remaining > 0:
+            with memoryview(buffer) as view:
+                read = self.readinto(view[:remaining])
+            if not read:
+                break
+            remaining -= read
+
+    def _cache(self, data):
+        self._consumed += len(data)
+        cache = self.cacheStream
+        if cache is not None:
+            cache.write(data)
+            if (self._consumed > self.spool_threshold
+                    and type(cache) is io.BytesIO):
+                # Spill the cache to a temporary file.
+                self.cacheStream = tempfile.TemporaryFile()
+                with cache.getbuffer() as view:
+                    self.cacheStream.write(view)
+                cache.close()
+
     def read(self, size=-1):
         data = self.stream.read(size)
-        self.cacheStream.write(data)
+        self._cache(data)
         return data
 
+    def readinto(self, buffer):
+        readinto = getattr(self.stream, 'readinto', None)
+        if readinto is None:
+            data = self.stream.read(len(buffer))
+            read = len(data)
+            buffer[:read] = data
+        else:
+            read = readinto(buffer) or 0
+        if read:
+            with memoryview(buffer) as view:
+                self._cache(view[:read])
+        return read
+
     def readline(self, size=None):
         # Previous versions of Twisted did not support the ``size`` argument
         # See http://twistedmatrix.com/trac/ticket/1451
@@ -268,14 +509,88 @@ class HTTPInputStream:
             data = self.stream.readline(size)
         else:
             data = self.stream.readline()
-        self.cacheStream.write(data)
+        self._cache(data)
         return data
 
     def readlines(self, hint=0):
         data = self.stream.readlines(hint)
-        self.cacheStream.write(b''.join(data))
+        self._cache(b''.join(data))
         return data
 
+    def readBlocks(self, block_size=65536, max_size=None):
+        """Iterate over the rest of the body in blocks of `block_size`.
+
+        Reading stops at the CONTENT_LENGTH of the request.  BadRequest is
+        raised if the body is larger than `max_size` bytes.
+        """
+        if max_size is not None and self.size > max_size:
+            raise BadRequest('The request body is too large')
+        remaining = self.size - self._consumed if self.size >= 0 else -1
+        while remaining:
+            size = block_size
+            if 0 < remaining < size:
+                size = remaining
+            data = self.read(size)
+            if not data:
+                break
+            if max_size is not None and self._consumed > max_size:
+                raise BadRequest('The request body is too large')
+            if remaining > 0:
+                remaining -= len(data)
+            yield data
+
+
+class RetryBudget:
+    """Process-wide token bucket limiting how often requests are retried.
+
+    Every retry takes a token and tokens are refilled at `rate` per second
+    up to `capacity`.  When the bucket is empty, requests are not retried
+    anymore until it refills, which keeps retry storms from piling up when
+    the conflict rate spikes.  A budget without a rate is unlimited and
+    only counts retries.
+    """
+
+    def __init__(self, rate=None, capacity=None):
+        self.rate = rate
+        if capacity is None:
+            capacity = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.retries = 0      # How many retries were performed
+        self.suppressed = 0   # How many retries were refused
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self):
+        """Is there a token left for a retry?"""
+        if self.rate is None:
+            return True
+        with self._lock:
+            self._refill()
+            return self.tokens >= 1
+
+    def try_acquire(self):
+        """Take a token for a retry.
+
+        Return whether the retry may be performed, counting it as
+        performed or as refused.
+        """
+        with self._lock:
+            if self.rate is not None:
+                self._refill()
+                if self.tokens < 1:
+                    self.suppressed += 1
+                    return False
+                self.tokens -= 1
+            self.retries += 1
+            return True
+
 
 DEFAULT_PORTS = {'http': '80', 'https': '443'}
 
@@ -332,7 +647,7 @@ class HTTPRequest(BaseRequest):
     __slots__ = (
         '__provides__',   # Allow request to directly provide interfaces
         '_auth',          # The value of the HTTP_AUTHORIZATION header.
-        '_cookies',       # The request cookies
+        '_cookie_data',   # The request cookies, None until parsed
         '_path_suffix',   # Extra traversal steps after normal traversal
         '_retry_count',   # How many times the request has been retried
         '_app_names',     # The application path as a sequence
@@ -342,14 +657,22 @@ class HTTPRequest(BaseRequest):
         'method',         # The upper-cased request method (REQUEST_METHOD)
         '_locale',        # The locale for the request
         '_vh_root',       # Object at the root of the virtual host
+        '_quoted_names',  # URL quoted application and traversed names
+        '_urls',          # Computed URLs, see getURL and getApplicationURL
+        '_charsets',      # See getCharsetsUsingRequest
     )
 
     retry_max_count = 3    # How many times we're willing to retry
+    retry_backoff = 0      # Initial delay between retries in seconds
+    retry_backoff_max = 1  # Maximum delay between retries in seconds
+    retry_budget = RetryBudget()  # Token bucket shared by all requests
 
     def __init__(self, body_instream, environ, response=None):
 
         super().__init__(
-            HTTPInputStream(body_instream, environ), environ, response)
+            HTTPInputStream(body_instream, environ,
+                            cache=self.retry_max_count > 0),
+            environ, response)
 
         self._orig_env = environ
         environ = sane_environment(environ)
@@ -364,34 +687,30 @@ class HTTPRequest(BaseRequest):
 
         self._environ = environ
 
-        self.__setupCookies()
+        self._cookie_data = None
+        self._charsets = None
         self.__setupPath()
+        self._invalidateURLs()
         self.__setupURLBase()
         self._vh_root = None
         self.setupLocale()
 
     def setupLocale(self):
-        envadapter = IUserPreferredLanguages(self, None)
-        if envadapter is None:
-            self._locale = None
-            return
-
-        langs = envadapter.getPreferredLanguages()
-        for httplang in langs:
-            parts = (httplang.split('-') + [None, None])[:3]
-            try:
-                self._locale = locales.getLocale(*parts)
-                return
-            except LoadLocaleError:
-                # Just try the next combination
-                pass
-        else:
-            # No combination gave us an existing locale, so use the default,
-            # which is guaranteed to exist
-            self._locale = locales.getLocale(None, None, None)
+        # The locale is looked up when it is first used, so that requests
+        # which never need it don't pay for language negotiation.
+        self._locale = _marker
 
     def _getLocale(self):
-        return self._locale
+        locale = self._locale
+        if locale is _marker:
+            envadapter = IUserPreferredLanguages(self, None)
+            if envadapter is None:
+                locale = None
+            else:
+                locale = _locale_for_languages(
+                    tuple(envadapter.getPreferredLanguages()))
+            self._locale = locale
+        return locale
     locale = property(_getLocale)
 
     def __setupURLBase(self):
@@ -449,32 +768,30 @@ class HTTPRequest(BaseRequest):
 
         # ignore cookies on a CookieError
         try:
-            c = cookies.SimpleCookie(text)
+            result.update(parse_cookie_header(text))
         except cookies.CookieError as e:
             eventlog.warning(e)
-            return result
-
-        for k, v in c.items():
-            # recode cookie value to ENCODING (UTF-8)
-            if not isinstance(k, bytes):
-                k = k.encode('latin1')
-            rk = k.decode(ENCODING)
-            v = v.value
-            if not isinstance(v, bytes):
-                v = v.encode('latin1')
-            rv = v.decode(ENCODING)
-            result[rk] = rv
 
         return result
 
-    def __setupCookies(self):
+    def _getCookies(self):
         # Cookie values should *not* be appended to existing form
         # vars with the same name - they are more like default values
         # for names not otherwise specified in the form.
-        self._cookies = {}
-        cookie_header = self._environ.get('HTTP_COOKIE', None)
-        if cookie_header is not None:
-            self._parseCookies(cookie_header, self._cookies)
+        result = self._cookie_data
+        if result is None:
+            result = {}
+            cookie_header = self._environ.get('HTTP_COOKIE', None)
+            if cookie_header is not None:
+                self._parseCookies(cookie_header, result)
+            self._cookie_data = result
+        return result
+
+    def _setCookies(self, cookies):
+        self._cookie_data = cookies
+
+    # The cookies are only parsed when first used.
+    _cookies = property(_getCookies, _setCookies)
 
     def __setupPath(self):
         # PATH_INFO is str here, so setupPath_helper sets up the
@@ -484,8 +801,39 @@ class HTTPRequest(BaseRequest):
     def supportsRetry(self):
         """See IPublisherRequest"""
         count = getattr(self, '_retry_count', 0)
-        if count < self.retry_max_count:
-            return True
+        return count < self.retry_max_count
+
+    def acquireRetry(self):
+        """Take a retry from the retry budget before retrying.
+
+        Return whether the request may be retried.  Unlike supportsRetry,
+        which publications may ask any number of times and which leaves
+        the budget out, this is called once by the publisher right before
+        it retries the request, so a retry refused by the budget is
+        counted once.
+        """
+        budget = self.retry_budget
+        return budget is None or budget.try_acquire()
+
+    def close(self):
+        """See IPublicationRequest."""
+        body = self._body_instream
+        super().close()
+        if body is not None:
+            body.close()
+
+    def getRetryDelay(self):
+        """Return the number of seconds to wait before retrying.
+
+        The delay grows exponentially with the number of retries, starting
+        at `retry_backoff` and capped at `retry_backoff_max`, and is
+        jittered so that conflicting requests don't retry in lockstep.
+        """
+        if not self.retry_backoff:
+            return 0
+        count = getattr(self, '_retry_count', 0)
+        return random.uniform(
+            0, min(self.retry_backoff_max, self.retry_backoff * 2 ** count))
 
     def retry(self):
         """See IPublisherRequest"""
@@ -503,6 +851,8 @@ class HTTPRequest(BaseRequest):
             # only ISkinnable requests have skins
             setDefaultSkin(request)
 
+        # The new request is responsible for our cache now.
+        request._body_instream.closeStream = True
         request.setPublication(self.publication)
         request._retry_count = self._retry_count
         return request
@@ -569,48 +919,76 @@ class HTTPRequest(BaseRequest):
         # Should be overridden by subclasses
         return HTTPResponse()
 
+    def _getQuotedNames(self):
+        # The quoted application and traversed names.  They are quoted
+        # incrementally as traversal goes on.
+        quoted = self._quoted_names
+        app_names = self._app_names
+        traversed_names = self._traversed_names
+        count = len(quoted)
+        if count < len(app_names) + len(traversed_names):
+            names = (app_names + traversed_names)[count:]
+            quoted.extend([_quote_name(name) for name in names])
+        return quoted
+
+    def _invalidateURLs(self):
+        self._quoted_names = []
+        self._urls = {}
+
     def getURL(self, level=0, path_only=False):
-        names = self._app_names + self._traversed_names
+        count = len(self._app_names) + len(self._traversed_names)
+        key = (level, path_only, count)
+        url = self._urls.get(key)
+        if url is not None:
+            return url
+
+        names = self._getQuotedNames()[:count]
         if level:
-            if level > len(names):
+            if level > count:
                 raise IndexError(level)
             names = names[:-level]
-        # See: http://www.ietf.org/rfc/rfc2718.txt, Section 2.2.5
-        names = [quote(name.encode("utf-8"), safe='/+@') for name in names]
 
         if path_only:
             if not names:
-                return '/'
-            return '/' + '/'.join(names)
+                url = '/'
+            else:
+                url = '/' + '/'.join(names)
         else:
             if not names:
-                return self._app_server
-            return "{}/{}".format(self._app_server, '/'.join(names))
+                url = self._app_server
+            else:
+                url = "{}/{}".format(self._app_server, '/'.join(names))
+        self._urls[key] = url
+        return url
 
     def getApplicationURL(self, depth=0, path_only=False):
         """See IHTTPApplicationRequest"""
-        if depth:
-            names = self._traversed_names
-            if depth > len(names):
-                raise IndexError(depth)
-            names = self._app_names + names[:depth]
-        else:
-            names = self._app_names
-
-        # See: http://www.ietf.org/rfc/rfc2718.txt, Section 2.2.5
-        names = [quote(name.encode("utf-8"), safe='/+@') for name in names]
+        traversed_names = self._traversed_names
+        if depth > len(traversed_names):
+            raise IndexError(depth)
+        if depth < 0:
+            depth = len(traversed_names[:depth])
+        key = ('app', depth, path_only, len(self._app_names))
+        url = self._urls.get(key)
+        if url is not None:
+            return url
+
+        names = self._getQuotedNames()[:len(self._app_names) + depth]
 
         if path_only:
-            return names and ('/' + '/'.join(names)) or '/'
+            url = names and ('/' + '/'.join(names)) or '/'
         else:
-            return (names
-                    and ("{}/{}".format(self._app_server, '/'.join(names)))
-                    or self._app_server)
+            url = (names
+                   and ("{}/{}".format(self._app_server, '/'.join(names)))
+                   or self._app_server)
+        self._urls[key] = url
+        return url
 
     def setApplicationServer(self, host, proto='http', port=None):
         if port and str(port) != DEFAULT_PORTS.get(proto):
             host = f'{host}:{port}'
         self._app_server = f'{proto}://{host}'
+        self._invalidateURLs()
         zope.event.notify(HTTPVirtualHostChangedEvent(self))
 
     def shiftNameToApplication(self):
@@ -622,6 +1000,7 @@ class HTTPRequest(BaseRequest):
         """
         if len(self._traversed_names) == 1:
             self._app_names.append(self._traversed_names.pop())
+            self._invalidateURLs()
             zope.event.notify(HTTPVirtualHostChangedEvent(self))
             return
 
@@ -632,6 +1011,7 @@ class HTTPRequest(BaseRequest):
         del self._traversed_names[:]
         self._vh_root = self._last_obj_traversed
         self._app_names = list(names)
+        self._invalidateURLs()
         zope.event.notify(HTTPVirtualHostChangedEvent(self))
 
     def getVirtualHostRoot(self):
@@ -647,6 +1027,11 @@ class HTTPRequest(BaseRequest):
     def get(self, key, default=None):
         """See Interface.Common.Mapping.IReadMapping"""
         marker = object()
+        if self._cookie_data is None and key.isascii():
+            # Don't parse the cookies for keys they can't contain
+            cookie_header = self._environ.get('HTTP_COOKIE', '')
+            if key not in cookie_header:
+                return super().get(key, default)
         result = self._cookies.get(key, marker)
         if result is not marker:
             return result
@@ -674,6 +1059,14 @@ class HTTPResponse(BaseResponse):
         '_charset',             # String: character set for the output
     )
 
+    # Sort the headers by name (case-insensitively) instead of returning
+    # them in the order they were set, e.g. for comparable output in tests.
+    sort_headers = False
+
+    # Requests for more byte ranges of a file result are answered with the
+    # whole file.
+    max_byte_ranges = 20
+
     def __init__(self):
         super().__init__()
         self.reset()
@@ -749,14 +1142,15 @@ class HTTPResponse(BaseResponse):
         result.append(
             ("X-Powered-By", "Zope (www.zope.org), Python (www.python.org)"))
 
-        for key, values in sorted(headers.items(), key=lambda x: x[0].lower()):
-            if key.lower() == key:
-                # only change non-literal header names
-                key = '-'.join([k.capitalize() for k in key.split('-')])
+        items = headers.items()
+        if self.sort_headers:
+            items = sorted(items, key=lambda x: x[0].lower())
+        for key, values in items:
+            key = _canonical_header_name(key)
             result.extend([(key, val) for val in values])
 
-        result.extend([tuple(cookie.split(': ', 1))
-                       for cookie in self._cookie_list()])
+        result.extend([('Set-Cookie', cookie)
+                       for cookie in self._set_cookie_values()])
 
         return result
 
@@ -801,11 +1195,23 @@ class HTTPResponse(BaseResponse):
 
     def setResult(self, result):
         """See IHTTPResponse"""
-        if IResult.providedBy(result):
+        if isinstance(result, StreamingResult):
+            r = self._streamingResult(result)
+        elif isinstance(result, FileResult):
+            r = self._fileResult(result)
+        elif IResult.providedBy(result):
             r = result
         else:
-            r = zope.component.queryMultiAdapter(
-                (result, self._request), IResult)
+            request = self._request
+            if type(result) in _implicit_result_types:
+                # Skip the registry unless an adapter is registered.
+                factory = _result_adapters.lookup(
+                    (type(result), providedBy(request)),
+                    (implementedBy(type(result)), providedBy(request)))
+                r = None if factory is None else factory(result, request)
+            else:
+                r = zope.component.queryMultiAdapter(
+                    (result, request), IResult)
             if r is None:
                 if isinstance(result, (str, bytes)):
                     r = result
@@ -862,11 +1268,7 @@ class HTTPResponse(BaseResponse):
             if (major, minor) != ('application', 'json'):
                 # The RFC says this is UTF-8, and the type has no params.
                 params['charset'] = encoding
-            content_type = f"{major}/{minor}"
-            if params:
-                content_type += ";"
-                content_type += ";".join(k + "=" + v
-                                         for k, v in params.items())
+            content_type = _join_content_type(major, minor, params)
 
         if content_type:
             headers = [('content-type', content_type),
@@ -876,6 +1278,96 @@ class HTTPResponse(BaseResponse):
 
         return body, headers
 
+    def _streamingResult(self, result):
+        # Return an iterator over the encoded chunks of the streaming
+        # result.  The first chunk is generated right away to set the
+        # headers.
+        chunks = iter(result.body)
+        first = next(chunks, b'')
+        encoding = self._streamingHeaders(first)
+        return _encoded_chunks(
+            itertools.chain((first,), chunks), encoding, result.body)
+
+    def _streamingHeaders(self, first):
+        # Set the headers of a streaming result starting with the chunk
+        # `first` and return the encoding for its str chunks.
+        # There is no Content-Length, so that servers can use chunked
+        # transfer encoding.
+        self._headers.pop('content-length', None)
+        content_type = self.getHeader('content-type') or ''
+        if not isinstance(first, str):
+            params = zope.contenttype.parse.parse(content_type)[2] \
+                if content_type else {}
+            return params.get('charset', 'utf-8')
+
+        if not unicode_mimetypes_re.match(content_type):
+            raise ValueError(
+                'str results must have a text, RFC 3023, RFC 4627,'
+                ' or +xml content type.')
+        major, minor, params = zope.contenttype.parse.parse(content_type)
+        # The body isn't known yet, so UTF-8 is used unless the application
+        # asked for a charset explicitly.
+        encoding = params.get('charset', 'utf-8')
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            encoding = 'utf-8'
+            del params['charset']
+        if (major, minor) != ('application', 'json'):
+            params['charset'] = encoding
+        self.setHeader('content-type',
+                       _join_content_type(major, minor, params))
+        return encoding
+
+    def _fileResult(self, result):
+        # The file result knows its size and validators, so the response
+        # can answer conditional and range requests for it.
+        self.setHeader('accept-ranges', 'bytes')
+        if result.last_modified is not None:
+            self.setHeader('last-modified',
+                           formatdate(result.last_modified, usegmt=True))
+        if result.etag is not None:
+            self.setHeader('etag', result.etag)
+
+        request = self._request
+        if (request is None or self._status_set
+                or getattr(request, 'method', None) not in ('GET', 'HEAD')):
+            self.setHeader('content-length', str(result.length))
+            return result
+
+        if _not_modified(request, result):
+            result.close()
+            self.setStatus(304)
+            return ()
+
+        ranges = _requested_ranges(request, result, self.max_byte_ranges)
+        if ranges is None:
+            self.setHeader('content-length', str(result.length))
+            return result
+
+        if not ranges:
+            result.close()
+            self.setStatus(416)
+            self.setHeader('content-range', 'bytes */%d' % result.length)
+            self.setHeader('content-length', '0')
+            return ()
+
+        self.setStatus(206)
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            self.setHeader('content-range',
+                           'bytes %d-%d/%d' % (start, end, result.length))
+            self.setHeader('content-length', str(end - start + 1))
+            return result.part(start, end - start + 1)
+
+        boundary = '%032x' % random.getrandbits(128)
+        content_type = self.getHeader('content-type')
+        self.setHeader('content-type',
+                       'multipart/byteranges; boundary=' + boundary)
+        length, body = _byteranges(result, ranges, boundary, content_type)
+        self.setHeader('content-length', str(length))
+        return body
+
     def handleException(self, exc_info):
         """
         Calls self.setBody() with an error response.
@@ -947,33 +1439,20 @@ class HTTPResponse(BaseResponse):
         self.setResult(DirectResult(()))
         return location
 
-    def _cookie_list(self):
-        try:
-            c = cookies.SimpleCookie()
-        except cookies.CookieError as e:
-            eventlog.warning(e)
-            return []
-        for name, attrs in self._cookies.items():
+    def _set_cookie_values(self):
+        # The values of the Set-Cookie headers, ordered by cookie name
+        # like http.cookies.SimpleCookie does.
+        result = []
+        for name, attrs in sorted(self._cookies.items()):
             name = str(name)
+            output = _set_cookie_value(name, attrs)
+            if output is None:
+                output = _simple_cookie_value(name, attrs)
+            result.append(output)
+        return result
 
-            # The Cookie module expects latin-1 unicode string.
-            cookieval = attrs['value'].encode(ENCODING)
-            c[name] = cookieval.decode('latin-1')
-
-            for k, v in attrs.items():
-                if k == 'value':
-                    continue
-                if k == 'secure':
-                    if v:
-                        c[name]['secure'] = True
-                    continue
-                if k == 'max_age':
-                    k = 'max-age'
-                elif k == 'comment':
-                    # Encode rather than throw an exception
-                    v = quote(v.encode('utf-8'), safe="/?:@&+")
-                c[name][k] = str(v)
-        return str(c).splitlines()
+    def _cookie_list(self):
+        return ['Set-Cookie: ' + value for value in self._set_cookie_values()]
 
     def write(*_):
         raise TypeError(
@@ -1009,64 +1488,89 @@ class HTTPCharsets:
 
     def getPreferredCharsets(self):
         '''See interface IUserPreferredCharsets'''
-        charsets = []
-        sawstar = sawiso88591 = 0
-        header_present = bool(self.request.get('HTTP_ACCEPT_CHARSET'))
-        for charset in self.request.get('HTTP_ACCEPT_CHARSET', '').split(','):
-            charset = charset.strip().lower()
-            if charset:
-                if ';' in charset:
+        return list(
+            _parse_accept_charset(self.request.get('HTTP_ACCEPT_CHARSET', '')))
+
+
+@functools.lru_cache(maxsize=256)
+def _parse_accept_charset(header):
+    """Return the charsets an Accept-Charset header value prefers."""
+    charsets = []
+    sawstar = sawiso88591 = 0
+    header_present = bool(header)
+    for charset in header.split(','):
+        charset = charset.strip().lower()
+        if charset:
+            if ';' in charset:
+                try:
+                    charset, quality = charset.split(';')
+                except ValueError:
+                    continue
+                if not quality.startswith('q='):
+                    # not a quality parameter
+                    quality = 1.0
+                else:
                     try:
-                        charset, quality = charset.split(';')
+                        quality = float(quality[2:])
                     except ValueError:
                         continue
-                    if not quality.startswith('q='):
-                        # not a quality parameter
-                        quality = 1.0
-                    else:
-                        try:
-                            quality = float(quality[2:])
-                        except ValueError:
-                            continue
-                else:
-                    quality = 1.0
-                if quality == 0.0:
-                    continue
-                if charset == '*':
-                    sawstar = 1
-                if charset == 'iso-8859-1':
-                    sawiso88591 = 1
-                charsets.append((quality, charset))
-        # Quoting RFC 2616, $14.2: If no "*" is present in an Accept-Charset
-        # field, then all character sets not explicitly mentioned get a
-        # quality value of 0, except for ISO-8859-1, which gets a quality
-        # value of 1 if not explicitly mentioned.
-        # And quoting RFC 2616, $14.2: "If no Accept-Charset header is
-        # present, the default is that any character set is acceptable."
-        if not sawstar and not sawiso88591 and header_present:
-            charsets.append((1.0, 'iso-8859-1'))
-        # UTF-8 is **always** preferred over anything else.
-        # Reason: UTF-8 is not specific and can encode the entire str
-        # range , unlike many other encodings. Since Zope can easily use very
-        # different ranges, like providing a French-Chinese dictionary, it is
-        # always good to use UTF-8.
-        charsets.sort(key=sort_charsets, reverse=True)
-        charsets = [charset for quality, charset in charsets]
-        if sawstar and 'utf-8' not in charsets:
-            charsets.insert(0, 'utf-8')
-        elif charsets == []:
-            charsets = ['utf-8']
-        return charsets
+            else:
+                quality = 1.0
+            if quality == 0.0:
+                continue
+            if charset == '*':
+                sawstar = 1
+            if charset == 'iso-8859-1':
+                sawiso88591 = 1
+            charsets.append((quality, charset))
+    # Quoting RFC 2616, $14.2: If no "*" is present in an Accept-Charset
+    # field, then all character sets not explicitly mentioned get a
+    # quality value of 0, except for ISO-8859-1, which gets a quality
+    # value of 1 if not explicitly mentioned.
+    # And quoting RFC 2616, $14.2: "If no Accept-Charset header is
+    # present, the default is that any character set is acceptable."
+    if not sawstar and not sawiso88591 and header_present:
+        charsets.append((1.0, 'iso-8859-1'))
+    # UTF-8 is **always** preferred over anything else.
+    # Reason: UTF-8 is not specific and can encode the entire str
+    # range , unlike many other encodings. Since Zope can easily use very
+    # different ranges, like providing a French-Chinese dictionary, it is
+    # always good to use UTF-8.
+    charsets.sort(key=sort_charsets, reverse=True)
+    charsets = [charset for quality, charset in charsets]
+    if sawstar and 'utf-8' not in charsets:
+        charsets.insert(0, 'utf-8')
+    elif charsets == []:
+        charsets = ['utf-8']
+    return tuple(charsets)
+
+
+def getCharsetsUsingRequest(request):
+    """Return the charsets preferred for `request` as a tuple.
+
+    Return None if the request can't be adapted to IUserPreferredCharsets.
+    The charsets of an HTTPRequest are negotiated only once.
+    """
+    memoize = isinstance(request, HTTPRequest)
+    if memoize and request._charsets is not None:
+        return request._charsets
+    envadapter = IUserPreferredCharsets(request, None)
+    if envadapter is None:
+        return None
+    charsets = tuple(envadapter.getPreferredCharsets())
+    if memoize:
+        request._charsets = charsets
+    return charsets
 
 
 def getCharsetUsingRequest(request):
     'See IHTTPResponse'
-    envadapter = IUserPreferredCharsets(request, None)
-    if envadapter is None:
+    charsets = getCharsetsUsingRequest(request)
+    if charsets is None:
         return
 
     try:
-        charset = envadapter.getPreferredCharsets()[0]
+        charset = charsets[0]
     except IndexError:
         # Exception caused by empty list! This is okay though, since the
         # browser just could have sent a '*', which means we can choose
@@ -1093,6 +1597,260 @@ class DirectResult:
         return iter(self.body)
 
 
+@zope.interface.implementer(IResult)
+class StreamingResult:
+    """A result whose body is generated while it is sent.
+
+    The body is an iterable of str or bytes chunks.  The response encodes
+    str chunks as they are sent, using the charset of the content type or
+    UTF-8.  No Content-Length is set, so the server can use chunked
+    transfer encoding.
+
+    Only the first chunk is generated during publication, the others are
+    generated after the request was closed (and the transaction ended).
+    """
+
+    def __init__(self, body):
+        self.body = body
+
+    def __iter__(self):
+        return _encoded_chunks(self.body, 'utf-8', self.body)
+
+
+@zope.interface.implementer(IResult)
+class FileResult:
+    """A result sending a file, or a part of it.
+
+    `file` is a file opened in binary mode or the path of a file.  `offset`
+    and `length` select the part of the file to send, by default all of it.
+    The last modification time (a timestamp or datetime) is taken from the
+    file unless given.
+
+    The response sets the Content-Length, Last-Modified and ETag headers
+    (`etag` defaults to one derived from the modification time, offset and
+    length) and answers conditional and Range requests.  WSGI servers
+    offering a ``wsgi.file_wrapper`` can send the file without
+    copying it through Python, e.g. with ``os.sendfile``.
+    """
+
+    block_size = 65536  # Bytes read at a time when iterating
+
+    def __init__(self, file, offset=0, length=None, last_modified=None,
+                 etag=None):
+        if isinstance(file, (str, bytes, os.PathLike)):
+            file = open(file, 'rb')
+        self.file = file
+
+        try:
+            stat = os.fstat(file.fileno())
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            self.size = file.seek(0, os.SEEK_END)
+            mtime = None
+        else:
+            self.size = stat.st_size
+            mtime = stat.st_mtime
+
+        if last_modified is None:
+            last_modified = mtime
+        elif isinstance(last_modified, datetime):
+            last_modified = last_modified.timestamp()
+        self.last_modified = last_modified
+
+        offset = min(offset, self.size)
+        if length is None or offset + length > self.size:
+            length = self.size - offset
+        self.offset = offset
+        self.length = length
+
+        if etag is None and last_modified is not None:
+            etag = '"%x-%x-%x"' % (int(last_modified), offset, length)
+        self.etag = etag
+
+    def part(self, offset, length):
+        """Return a result sending `length` bytes from `offset` of this one.
+        """
+        result = copy.copy(self)
+        result.offset = self.offset + offset
+        result.length = min(length, self.length - offset)
+        return result
+
+    def extendsToEnd(self):
+        """Is the file sent up to its end?"""
+        return self.offset + self.length >= self.size
+
+    def __iter__(self):
+        try:
+            yield from self._read()
+        finally:
+            self.file.close()
+
+    def _read(self):
+        file = self.file
+        remaining = self.length
+        file.seek(self.offset)
+        while remaining > 0:
+            data = file.read(min(self.block_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+    def close(self):
+        self.file.close()
+
+
+_byte_range_match = re.compile(r'\s*(\d*)\s*-\s*(\d*)\s*$', re.ASCII).match
+
+
+def _parse_byte_ranges(header, size, max_ranges):
+    # Return the ranges of the Range `header` as a list of (first, last)
+    # byte positions.  None means the header is to be ignored, an empty
+    # list that none of the ranges can be satisfied.  Overlapping and
+    # adjacent ranges are coalesced.
+    unit, sep, spec = header.partition('=')
+    if not sep or unit.strip().lower() != 'bytes':
+        return None
+    ranges = []
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        match = _byte_range_match(item)
+        if match is None:
+            return None
+        first, last = match.groups()
+        if not first:
+            if not last:
+                return None
+            # A suffix range: the last bytes of the file
+            length = int(last)
+            if length:
+                ranges.append((max(size - length, 0), size - 1))
+            continue
+        first = int(first)
+        last = int(last) if last else size - 1
+        if last < first:
+            return None
+        if first < size:
+            ranges.append((first, min(last, size - 1)))
+    if len(ranges) > max_ranges:
+        return None
+
+    ranges.sort()
+    result = []
+    for first, last in ranges:
+        if result and first <= result[-1][1] + 1:
+            result[-1] = (result[-1][0], max(last, result[-1][1]))
+        else:
+            result.append((first, last))
+    return result
+
+
+def _etags(header):
+    return [tag.strip() for tag in header.split(',')]
+
+
+def _weak_etag(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def _http_timestamp(value):
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if date.tzinfo is None:
+        # HTTP dates are always in GMT
+        date = date.replace(tzinfo=timezone.utc)
+    return date.timestamp()
+
+
+def _not_modified(request, result):
+    # Do the conditional request headers allow answering with 304?
+    if_none_match = request.getHeader('If-None-Match')
+    if if_none_match is not None:
+        if result.etag is None:
+            return False
+        tags = _etags(if_none_match)
+        return '*' in tags or _weak_etag(result.etag) in map(_weak_etag, tags)
+
+    if_modified_since = request.getHeader('If-Modified-Since')
+    if if_modified_since is not None and result.last_modified is not None:
+        since = _http_timestamp(if_modified_since)
+        return since is not None and int(result.last_modified) <= since
+    return False
+
+
+def _requested_ranges(request, result, max_ranges):
+    # The ranges of the file result to send or None for all of it.
+    header = request.getHeader('Range')
+    if header is None:
+        return None
+
+    if_range = request.getHeader('If-Range')
+    if if_range is not None:
+        if_range = if_range.strip()
+        if if_range.startswith(('"', 'W/"')):
+            # Only strong entity tags match.
+            if result.etag is None or result.etag.startswith('W/') \
+                    or if_range != result.etag:
+                return None
+        elif (result.last_modified is None
+              or _http_timestamp(if_range) != int(result.last_modified)):
+            return None
+
+    return _parse_byte_ranges(header, result.length, max_ranges)
+
+
+def _byteranges(result, ranges, boundary, content_type):
+    # Return the length and an iterator of a multipart/byteranges body
+    # with the `ranges` of the file result.
+    heads = []
+    for first, last in ranges:
+        head = '\r\n--%s\r\n' % boundary
+        if content_type:
+            head += 'Content-Type: %s\r\n' % content_type
+        head += 'Content-Range: bytes %d-%d/%d\r\n\r\n' % (
+            first, last, result.length)
+        heads.append(head.encode('latin-1'))
+    # The first boundary doesn't need the preceding line break.
+    heads[0] = heads[0][2:]
+    tail = ('\r\n--%s--\r\n' % boundary).encode('latin-1')
+    length = (sum(len(head) for head in heads) + len(tail)
+              + sum(last - first + 1 for first, last in ranges))
+
+    def body():
+        try:
+            for head, (first, last) in zip(heads, ranges):
+                yield head
+                yield from result.part(first, last - first + 1)._read()
+            yield tail
+        finally:
+            result.close()
+
+    return length, body()
+
+
+def _encoded_chunks(chunks, encoding, body):
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(encoding)
+            if chunk:
+                yield chunk
+    finally:
+        close = getattr(body, 'close', None)
+        if close is not None:
+            close()
+
+
+def _join_content_type(major, minor, params):
+    content_type = f"{major}/{minor}"
+    if params:
+        content_type += ";"
+        content_type += ";".join(k + "=" + v for k, v in params.items())
+    return content_type
+
+
 # BBB
 try:
     from zope.login.http import BasicAuthAdapter  # noqa: F401 import unused
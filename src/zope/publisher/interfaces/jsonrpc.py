@@ -0,0 +1,55 @@
+##############################################################################
+#
+# Copyright (c) Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Interfaces for the JSON-RPC publisher.
+"""
+
+__docformat__ = "reStructuredText"
+
+from zope.interface import Interface
+
+from zope.publisher.interfaces import IPublication
+from zope.publisher.interfaces import IPublishTraverse
+from zope.publisher.interfaces import IView
+from zope.publisher.interfaces.http import IHTTPRequest
+
+
+class IJSONRPCPublisher(IPublishTraverse):
+    """JSON-RPC Publisher"""
+
+
+class IJSONRPCPublication(IPublication):
+    """Object publication framework."""
+
+    def getDefaultTraversal(request, ob):
+        """Get the default published object for the request
+
+        Allows a default view to be added to traversal.
+        Returns (ob, steps_reversed).
+        """
+
+
+class IJSONRPCRequest(IHTTPRequest):
+    """JSON-RPC 2.0 Request
+    """
+
+
+class IJSONRPCView(IView):
+    """JSON-RPC View"""
+
+
+class IJSONRPCPremarshaller(Interface):
+    """Pre-Marshaller to remove proxies for the JSON encoder"""
+
+    def __call__(self):
+        """Return the given object without proxies."""
@@ -0,0 +1,429 @@
+##############################################################################
+#
+# Copyright (c) Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""JSON-RPC Publisher
+
+This module contains the JSONRPCRequest and JSONRPCResponse, which publish
+JSON-RPC 2.0 calls and batches the way the XML-RPC publisher publishes
+XML-RPC calls.
+"""
+import datetime
+import json
+import sys
+from io import BytesIO
+
+import zope.component
+from zope.interface import implementer
+from zope.security.proxy import isinstance
+
+from zope.publisher.http import DirectResult
+from zope.publisher.http import HTTPRequest
+from zope.publisher.http import HTTPResponse
+from zope.publisher.http import StreamingResult
+from zope.publisher.interfaces import NotFound
+from zope.publisher.interfaces.jsonrpc import IJSONRPCPremarshaller
+from zope.publisher.interfaces.jsonrpc import IJSONRPCRequest
+from zope.publisher.interfaces.jsonrpc import IJSONRPCView
+from zope.publisher.xmlrpc import MultiCallBase
+from zope.publisher.xmlrpc import Premarshal
+
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+_marker = object()
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+class JSONRPCError(Exception):
+    """An error reported to the client as a JSON-RPC error object."""
+
+    def __init__(self, code, message, data=None):
+        super().__init__(code, message)
+        self.code = code
+        self.message = message
+        self.data = data
+
+    def __str__(self):
+        return self.message
+
+
+def _parseCall(call):
+    # Return the method name, the positional and named parameters and the
+    # id (_marker for notifications) of a JSON-RPC request object.
+    if not isinstance(call, dict) or call.get('jsonrpc') != '2.0':
+        raise JSONRPCError(INVALID_REQUEST, 'Invalid Request')
+    method = call.get('method')
+    if not isinstance(method, str) or not method:
+        raise JSONRPCError(INVALID_REQUEST, 'Invalid Request')
+    params = call.get('params', ())
+    if isinstance(params, dict):
+        args, kw = (), params
+    elif isinstance(params, (list, tuple)):
+        args, kw = tuple(params), {}
+    else:
+        raise JSONRPCError(INVALID_REQUEST, 'Invalid Request')
+    return method, args, kw, call.get('id', _marker)
+
+
+@implementer(IJSONRPCRequest)
+class JSONRPCRequest(HTTPRequest):
+
+    _args = ()
+    _params = {}
+    _id = None
+    _notification = False
+    _calls = None
+
+    # Decodes the request body, passed as bytes.  Set this to the loads
+    # function of a faster JSON library in a subclass.
+    json_loads = staticmethod(json.loads)
+
+    # How batches are published, see XMLRPCRequest.multicall: 'request'
+    # makes all calls in the publication of the request, committing the
+    # side effects of failing calls with the others, 'call' ends the
+    # publication after each call.
+    batch = 'request'
+
+    # The largest request body accepted, in bytes, or None for no limit.
+    max_body_size = None
+
+    # The size of the blocks the request body is read in.
+    read_block_size = 1 << 16
+
+    def _createResponse(self):
+        """Create a specific JSON-RPC response object."""
+        return JSONRPCResponse()
+
+    def processInputs(self):
+        """See IPublisherRequest."""
+        body = b''.join(self._body_instream.readBlocks(
+            self.read_block_size, self.max_body_size))
+        try:
+            data = self.json_loads(body)
+        except ValueError:
+            raise JSONRPCError(PARSE_ERROR, 'Parse error')
+
+        if isinstance(data, list):
+            if not data:
+                raise JSONRPCError(INVALID_REQUEST, 'Invalid Request')
+            self._calls = data
+            return
+
+        if isinstance(data, dict):
+            self._id = data.get('id')
+        method, self._args, self._params, id = _parseCall(data)
+        if id is _marker:
+            self._notification = True
+
+        # Translate '.' to '/' in method to represent object traversal.
+        self.setPathSuffix(method.split('.'))
+
+    def traverse(self, obj):
+        """See IPublisherRequest."""
+        ob = super().traverse(obj)
+        if self._calls is not None:
+            ob = BatchCall(ob, self)
+        return ob
+
+    def get(self, key, default=None):
+        """See Interface.Common.Mapping.IReadMapping"""
+        # Named parameters are passed to the published method by name.
+        params = self._params
+        if key in params:
+            return params[key]
+        return super().get(key, default)
+
+
+class TestRequest(JSONRPCRequest):
+
+    def __init__(self, body_instream=None, environ=None, response=None, **kw):
+
+        _testEnv = {
+            'SERVER_URL': 'http://127.0.0.1',
+            'HTTP_HOST': '127.0.0.1',
+            'CONTENT_LENGTH': '0',
+            'GATEWAY_INTERFACE': 'TestFooInterface/1.0',
+        }
+
+        if environ:
+            _testEnv.update(environ)
+        if kw:
+            _testEnv.update(kw)
+        if body_instream is None:
+            body_instream = BytesIO(b'')
+
+        super().__init__(body_instream, _testEnv, response)
+
+
+class JSONRPCResponse(HTTPResponse):
+    """JSON-RPC response.
+
+    This object is responsible for converting all output to JSON-RPC
+    response objects.
+    """
+
+    # Encodes the response, returning str or bytes.  Set this to the dumps
+    # function of a faster JSON library in a subclass.
+    json_dumps = staticmethod(_encoder.encode)
+
+    # Set this to True to encode results while they are sent instead of
+    # encoding the complete response first.  Only errors while encoding
+    # the first block can then be reported as error objects.
+    stream_results = False
+
+    def setResult(self, result):
+        """Set the result of the response
+
+        The result is sent as the result of the JSON-RPC response object,
+        or, for batches, as the list of the response objects.
+        """
+        request = self._request
+        if getattr(request, '_calls', None) is not None:
+            body = premarshal(result)
+            if not body:
+                # The batch consisted of notifications only.
+                self._setNoContent()
+                return
+        elif getattr(request, '_notification', False):
+            self._setNoContent()
+            return
+        else:
+            body = {'jsonrpc': '2.0',
+                    'result': premarshal(result),
+                    'id': getattr(request, '_id', None)}
+        try:
+            self._setBody(body)
+        except:  # noqa: E722 do not use bare 'except'
+            # We really want to catch all exceptions at this point!
+            self.handleException(sys.exc_info())
+
+    def handleException(self, exc_info):
+        """Handle errors during publishing and report them as error object
+
+        >>> import sys
+        >>> resp = JSONRPCResponse()
+        >>> try:
+        ...     raise AttributeError('xyz')
+        ... except:
+        ...     exc_info = sys.exc_info()
+        ...     resp.handleException(exc_info)
+
+        >>> resp.getStatusString()
+        '200 Ok'
+        >>> resp.getHeader('content-type')
+        'application/json'
+        >>> print(resp.consumeBody().decode())
+        {"jsonrpc":"2.0","error":{"code":-32603,"message":"Unexpected Zope
+        exception: AttributeError: xyz"},"id":null}
+        """
+        request = self._request
+        if getattr(request, '_notification', False):
+            self._setNoContent()
+            return
+        self._setBody({'jsonrpc': '2.0',
+                       'error': _error(exc_info),
+                       'id': getattr(request, '_id', None)})
+        # JSON-RPC over HTTP reports errors with a status of 200 ("ok").
+        self.setStatus(200)
+
+    def _setBody(self, body):
+        if self.stream_results:
+            self.setHeader('content-type', 'application/json')
+            super().setResult(
+                StreamingResult(_iterencode(body, self.json_dumps)))
+            return
+
+        body = self.json_dumps(body)
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        headers = [('content-type', 'application/json'),
+                   ('content-length', str(len(body)))]
+        self._headers.update({k: [v] for (k, v) in headers})
+        super().setResult(DirectResult((body,)))
+
+    def _setNoContent(self):
+        # Notifications are not answered.
+        self._headers.pop('content-type', None)
+        self._headers.pop('content-length', None)
+        super().setResult(DirectResult(()))
+        self.setStatus(204)
+
+
+def _error(exc_info):
+    """Return the JSON-RPC error object reporting the exception `exc_info`."""
+    t, value = exc_info[:2]
+    if isinstance(value, JSONRPCError):
+        error = {'code': value.code, 'message': value.message}
+        if value.data is not None:
+            error['data'] = premarshal(value.data)
+        return error
+    if isinstance(value, NotFound):
+        return {'code': METHOD_NOT_FOUND, 'message': 'Method not found'}
+
+    # Like XML-RPC faults, we throw away most of the debugging information.
+    try:
+        s = '{}: {}'.format(getattr(t, '__name__', t), value)
+        if isinstance(value, Exception):
+            message = "Unexpected Zope exception: " + s
+        else:
+            message = "Unexpected Zope error value: " + s
+    except:  # noqa: E722 do not use bare 'except'
+        message = "Unknown Zope fault type"
+    return {'code': INTERNAL_ERROR, 'message': message}
+
+
+def _iterencode(body, encode, block_size=1 << 16):
+    # Encode `body` with `encode`, yielding the UTF-8 encoded JSON in
+    # blocks of about `block_size` bytes.  Only the items of the outer
+    # arrays and objects are encoded separately.
+    out = []
+    size = 0
+    for part in _encodeParts(body, encode, 3):
+        if not isinstance(part, bytes):
+            part = part.encode('utf-8')
+        out.append(part)
+        size += len(part)
+        if size >= block_size:
+            yield b''.join(out)
+            out.clear()
+            size = 0
+    yield b''.join(out)
+
+
+def _encodeParts(value, encode, depth):
+    if depth and type(value) in (list, tuple):
+        yield '['
+        for i, item in enumerate(value):
+            if i:
+                yield ','
+            yield from _encodeParts(item, encode, depth - 1)
+        yield ']'
+    elif (depth and type(value) is dict
+          and all(type(key) is str for key in value)):
+        yield '{'
+        for i, (key, item) in enumerate(value.items()):
+            yield ',"' if i else '"'
+            yield encode(key)[1:-1]
+            yield '":'
+            yield from _encodeParts(item, encode, depth - 1)
+        yield '}'
+    else:
+        yield encode(value)
+
+
+class BatchCall(MultiCallBase):
+    """The calls of a JSON-RPC batch request.
+
+    Calling it makes the calls and returns the response objects of the
+    calls which aren't notifications.
+    """
+
+    def __call__(self):
+        request = self.request
+        each = request.batch == 'call'
+        responses = []
+        for call in request._calls:
+            try:
+                method, args, params, id = _parseCall(call)
+            except JSONRPCError:
+                # Invalid calls aren't published, just answered.
+                id = call.get('id') if isinstance(call, dict) else None
+                responses.append(
+                    {'jsonrpc': '2.0', 'error': _error(sys.exc_info()),
+                     'id': id})
+                continue
+            failed, value = self._publishCall(
+                each, _error, self._traverseCall, method, args, params)
+            if id is not _marker:
+                responses.append(
+                    {'jsonrpc': '2.0', 'error' if failed else 'result': value,
+                     'id': id})
+        request._args, request._params = (), {}
+        return responses
+
+    def _traverseCall(self, method, args, params):
+        # Traverse to the object publishing `method` and set up its
+        # arguments.
+        ob = self._traverse(method)
+        self.request._args, self.request._params = args, params
+        return ob
+
+
+@implementer(IJSONRPCView)
+class JSONRPCView:
+    """A base JSON-RPC view that can be used as mix-in for JSON-RPC views."""
+
+    def __init__(self, context, request):
+        self.context = context
+        self.request = request
+
+
+@implementer(IJSONRPCPremarshaller)
+class PreMarshallerBase:
+    """Abstract base class for pre-marshallers."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def __call__(self):
+        raise Exception("Not implemented")
+
+
+@zope.component.adapter(dict)
+class DictPreMarshaller(PreMarshallerBase):
+    """Pre-marshaller for dicts"""
+
+    def __call__(self):
+        return {premarshal(k): premarshal(v)
+                for (k, v) in self.data.items()}
+
+
+@zope.component.adapter(list)
+class ListPreMarshaller(PreMarshallerBase):
+    """Pre-marshaller for list"""
+
+    def __call__(self):
+        return [premarshal(x) for x in self.data]
+
+
+@zope.component.adapter(tuple)
+class TuplePreMarshaller(ListPreMarshaller):
+    pass
+
+
+@zope.component.adapter(datetime.date)
+class DatePreMarshaller(PreMarshallerBase):
+    """Pre-marshaller for datetime.date and datetime.datetime"""
+
+    def __call__(self):
+        return self.data.isoformat()
+
+
+def premarshal(data):
+    """Premarshal data before handing it to the JSON encoder
+
+    Like `zope.publisher.xmlrpc.premarshal`, this removes security proxies
+    without resorting to removeSecurityProxy.
+    """
+    return _premarshal(data)
+
+
+_premarshal = Premarshal(
+    IJSONRPCPremarshaller,
+    (DictPreMarshaller,),
+    (ListPreMarshaller, TuplePreMarshaller))
@@ -16,6 +16,7 @@ import sys
 
 import zope.publisher.browser
 import zope.publisher.http
+import zope.publisher.jsonrpc
 import zope.publisher.publish
 
 
@@ -23,10 +24,27 @@ PY39 = sys.version_info[0:2] < (3, 10)
 
 browser_methods = {'GET', 'HEAD', 'POST'}
 
+# Request classes for POST requests by content type, used when the
+# jsonrpc option is set.
+jsonrpc_content_types = {
+    'application/json': zope.publisher.jsonrpc.JSONRPCRequest,
+}
+
+# WSGI environment key under which the per-phase publication timings are
+# made available to middleware (see the record_timings option).
+TIMINGS_ENVIRON_KEY = 'zope.publisher.timings'
+
+
+def asbool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', 'yes', 'on', '1')
+    return bool(value)
+
 
 class Application:
 
-    def __init__(self, global_config, publication, **options):
+    def __init__(self, global_config, publication, record_timings=False,
+                 jsonrpc=False, **options):
         if not publication.startswith('egg:'):
             raise ValueError(
                 'Invalid publication: .\n'
@@ -37,26 +55,56 @@ class Application:
         pub_class = get_egg(publication[4:],
                             'zope.publisher.publication_factory')
         self.publication = pub_class(global_config, **options)
+        self.record_timings = asbool(record_timings)
+        self.jsonrpc = asbool(jsonrpc)
 
     def __call__(self, environ, start_response):
+        request = self._publish(environ)
+        response = request.response
+
+        # Start the WSGI server response
+        start_response(response.getStatusString(), response.getHeaders())
+
+        # Return the result body iterable.
+        body = response.consumeBodyIter()
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if (file_wrapper is not None
+                and isinstance(body, zope.publisher.http.FileResult)
+                and body.extendsToEnd()):
+            # The server sends the file from the current position to its
+            # end, possibly with sendfile.
+            body.file.seek(body.offset)
+            return file_wrapper(body.file, body.block_size)
+        return body
+
+    def _publish(self, environ):
         request = self.request(environ)
         request.setPublication(self.publication)
 
+        if self.record_timings:
+            timer = zope.publisher.publish.PublicationTimer()
+            request.annotations[
+                zope.publisher.publish.PUBLICATION_TIMER_KEY] = timer
+
         # Let's support post-mortem debugging
         handle_errors = environ.get('wsgi.handleErrors', True)
 
         request = zope.publisher.publish.publish(
             request, handle_errors=handle_errors)
-        response = request.response
 
-        # Start the WSGI server response
-        start_response(response.getStatusString(), response.getHeaders())
+        if self.record_timings:
+            environ[TIMINGS_ENVIRON_KEY] = timer.getRecord()
 
-        # Return the result body iterable.
-        return response.consumeBodyIter()
+        return request
 
     def request(self, environ):
         method = environ.get('REQUEST_METHOD', 'GET').upper()
+        if self.jsonrpc and method == 'POST':
+            content_type = environ.get('CONTENT_TYPE', '')
+            content_type = content_type.split(';', 1)[0].strip().lower()
+            rc = jsonrpc_content_types.get(content_type)
+            if rc is not None:
+                return rc(environ['wsgi.input'], environ)
         if method in browser_methods:
             rc = zope.publisher.browser.BrowserRequest
         else:
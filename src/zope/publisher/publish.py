@@ -15,7 +15,12 @@
 
 Provide an apply-like facility that works with any mapping object
 """
+import asyncio
+import inspect
+import queue
 import sys
+import time
+import types
 
 from zope.interface import implementer
 from zope.proxy import removeAllProxies
@@ -63,13 +68,25 @@ def unwrapMethod(obj):
     return unwrapped, wrapperCount
 
 
+def _unwrapCallable(unwrapped):
+    # Shortcut the most common callables (functions and methods bound to
+    # a function) before falling back to the generic unwrapMethod().
+    kind = type(unwrapped)
+    if kind is types.FunctionType:
+        return unwrapped, 0
+    if (kind is types.MethodType
+            and type(unwrapped.__func__) is types.FunctionType):
+        return unwrapped.__func__, 1
+    return unwrapMethod(unwrapped)
+
+
 def mapply(obj, positional=(), request={}):
     __traceback_info__ = obj
 
     # we need deep access for introspection. Waaa.
     unwrapped = removeAllProxies(obj)
 
-    unwrapped, wrapperCount = unwrapMethod(unwrapped)
+    unwrapped, wrapperCount = _unwrapCallable(unwrapped)
 
     code = getattr(unwrapped, '__code__', None)
     if code is None:
@@ -125,7 +142,111 @@ def debug_call(obj, args):
     return obj(*args)
 
 
-def publish(request, handle_errors=True):
+PUBLICATION_TIMER_KEY = 'zope.publisher.publish.PublicationTimer'
+
+
+class PublicationTimer:
+    """Records how long each phase of publish() takes.
+
+    Store an instance in ``request.annotations[PUBLICATION_TIMER_KEY]``
+    before calling publish() to enable recording.  Durations are
+    monotonic nanoseconds summed over all attempts of the request; the
+    timer follows the request through retries and counts them.
+    """
+
+    def __init__(self):
+        self.durations = {}
+        self.retries = 0
+        self.total = 0
+        self._started = None
+        self._last = None
+
+    def start(self):
+        """Start (or resume) timing at the beginning of publish()."""
+        self._started = self._last = time.monotonic_ns()
+
+    def mark(self, phase):
+        """Attribute the time since the previous mark to `phase`."""
+        now = time.monotonic_ns()
+        durations = self.durations
+        durations[phase] = durations.get(phase, 0) + now - self._last
+        self._last = now
+
+    def stop(self):
+        """Stop timing at the end of publish()."""
+        if self._started is not None:
+            self.total += time.monotonic_ns() - self._started
+            self._started = None
+
+    def getRecord(self):
+        """Return the timings as a flat mapping suitable for logging."""
+        record = {phase + '_ns': duration
+                  for phase, duration in self.durations.items()}
+        record['total_ns'] = self.total
+        record['retries'] = self.retries
+        return record
+
+
+class _NullTimer:
+    """Stands in for a PublicationTimer when timing is not enabled."""
+
+    def start(self):
+        pass
+
+    def mark(self, phase):
+        pass
+
+    def stop(self):
+        pass
+
+
+_null_timer = _NullTimer()
+
+
+def getPublicationTimer(request):
+    """Return the timer recording `request`, or None."""
+    annotations = getattr(request, 'annotations', None)
+    if annotations is None:
+        return None
+    return annotations.get(PUBLICATION_TIMER_KEY)
+
+
+def _acquireRetry(request):
+    acquireRetry = getattr(request, 'acquireRetry', None)
+    if acquireRetry is None:
+        return True
+    return acquireRetry()
+
+
+def _getRetryDelay(request):
+    getRetryDelay = getattr(request, 'getRetryDelay', None)
+    if getRetryDelay is None:
+        return 0
+    return getRetryDelay()
+
+
+# The kinds of steps _publish() yields: calls into the request and the
+# publication, the call of the published object and sleeping.
+_CALL = 'call'
+_CALL_OBJECT = 'callObject'
+_SLEEP = 'sleep'
+
+
+def _publish(request, handle_errors, cancellable=False):
+    """Publish `request`, yielding the calls into the application.
+
+    This generator implements the retry and exception handling shared by
+    publish() and publish_async().  It yields ``(kind, func, args)``
+    steps.  The function running it calls ``func(*args)`` (or sleeps
+    ``args[0]`` seconds for _SLEEP steps) and sends back the result or
+    throws in the exception raised.  It returns the published request.
+
+    With `cancellable`, exceptions which aren't Exceptions (e.g.
+    asyncio.CancelledError) are not handled by the publication, they are
+    raised once the request has been ended and closed.
+    """
+    timer = getPublicationTimer(request) or _null_timer
+    timer.start()
     try:  # finally to clean up to_raise and close request
         to_raise = None
         while True:
@@ -135,24 +256,52 @@ def publish(request, handle_errors=True):
                     obj = None
                     try:
                         try:
-                            request.processInputs()
-                            publication.beforeTraversal(request)
-
-                            obj = publication.getApplication(request)
-                            obj = request.traverse(obj)
-                            publication.afterTraversal(request, obj)
-
-                            result = publication.callObject(request, obj)
+                            phase = 'processInputs'
+                            yield _CALL, request.processInputs, ()
+                            timer.mark(phase)
+                            phase = 'beforeTraversal'
+                            yield (_CALL, publication.beforeTraversal,
+                                   (request,))
+                            timer.mark(phase)
+
+                            phase = 'getApplication'
+                            obj = yield (_CALL, publication.getApplication,
+                                         (request,))
+                            timer.mark(phase)
+                            phase = 'traverse'
+                            obj = yield _CALL, request.traverse, (obj,)
+                            timer.mark(phase)
+                            phase = 'afterTraversal'
+                            yield (_CALL, publication.afterTraversal,
+                                   (request, obj))
+                            timer.mark(phase)
+
+                            phase = 'callObject'
+                            result = yield (_CALL_OBJECT,
+                                            publication.callObject,
+                                            (request, obj))
+                            timer.mark(phase)
                             response = request.response
                             if result is not response:
-                                response.setResult(result)
+                                phase = 'setResult'
+                                yield _CALL, response.setResult, (result,)
+                                timer.mark(phase)
 
-                            publication.afterCall(request, obj)
+                            phase = 'afterCall'
+                            yield _CALL, publication.afterCall, (request, obj)
+                            timer.mark(phase)
 
                         except:  # noqa: E722 do not use bare 'except'
                             exc_info = sys.exc_info()
-                            publication.handleException(
-                                obj, request, exc_info, True)
+                            # Don't count the failed phase as part of the
+                            # exception handling.
+                            timer.mark(phase)
+                            if cancellable and not isinstance(
+                                    exc_info[1], Exception):
+                                raise
+                            yield (_CALL, publication.handleException,
+                                   (obj, request, exc_info, True))
+                            timer.mark('handleException')
 
                             if not handle_errors:
                                 # Reraise only if there is no adapter
@@ -164,22 +313,31 @@ def publish(request, handle_errors=True):
                                     raise
                     finally:
                         exc_info = None  # Avoid circular reference.
-                        publication.endRequest(request, obj)
+                        yield _CALL, publication.endRequest, (request, obj)
+                        timer.mark('endRequest')
 
                     break  # Successful.
 
                 except Retry as retryException:
-                    if request.supportsRetry():
+                    if request.supportsRetry() and _acquireRetry(request):
+                        delay = _getRetryDelay(request)
+                        if delay:
+                            yield _SLEEP, None, (delay,)
                         # Create a copy of the request and use it.
-                        newrequest = request.retry()
-                        request.close()
+                        newrequest = yield _CALL, request.retry, ()
+                        yield _CALL, request.close, ()
                         request = newrequest
+                        if timer is not _null_timer:
+                            timer.retries += 1
+                            request.annotations[PUBLICATION_TIMER_KEY] = timer
+                            timer.mark('retry')
                     elif handle_errors:
                         # Output the original exception.
                         publication = request.publication
-                        publication.handleException(
-                            obj, request,
-                            retryException.getOriginalException(), False)
+                        yield (_CALL, publication.handleException,
+                               (obj, request,
+                                retryException.getOriginalException(),
+                                False))
                         break
                     else:
                         to_raise = retryException.getOriginalException()
@@ -192,6 +350,9 @@ def publish(request, handle_errors=True):
             except:  # noqa: E722 do not use bare 'except'
                 # Bad exception handler or retry method.
                 # Re-raise after outputting the response.
+                if cancellable and not isinstance(
+                        sys.exc_info()[1], Exception):
+                    raise
                 if handle_errors:
                     request.response.internalError()
                     to_raise = sys.exc_info()
@@ -205,13 +366,149 @@ def publish(request, handle_errors=True):
 
     finally:
         to_raise = None  # Avoid circ. ref.
-        request.close()  # Close database connections, etc.
+        # Close database connections, etc.
+        yield _CALL, request.close, ()
+        timer.stop()
 
-    # Return the request, since it might be a different object than the one
-    # that was passed in.
     return request
 
 
+def publish(request, handle_errors=True):
+    steps = _publish(request, handle_errors)
+    result = error = None
+    try:
+        while True:
+            try:
+                if error is None:
+                    kind, func, args = steps.send(result)
+                else:
+                    kind, func, args = steps.throw(error)
+            except StopIteration as stop:
+                # Return the request, since it might be a different object
+                # than the one that was passed in.
+                return stop.value
+            result = error = None
+            try:
+                if kind is _SLEEP:
+                    time.sleep(*args)
+                else:
+                    result = func(*args)
+            except:  # noqa: E722 do not use bare 'except'
+                # Handled by _publish().
+                error = sys.exc_info()[1]
+    finally:
+        error = None  # Avoid circular reference.
+
+
+def _setFutureResult(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+def _setFutureException(future, exception):
+    if not future.done():
+        future.set_exception(exception)
+
+
+class _RequestWorker:
+    """Makes the synchronous calls publishing one request.
+
+    Publications commonly keep per-request state such as the transaction
+    or the security interaction in thread-locals, so all calls are made
+    in the same thread of `executor` (the default executor of the event
+    loop if None).  The thread is taken when the first call is made and
+    given back when the worker is closed.
+    """
+
+    def __init__(self, loop, executor):
+        self._loop = loop
+        self._executor = executor
+        self._calls = None
+        self._done = None
+
+    async def call(self, func, *args):
+        if self._calls is None:
+            self._calls = queue.SimpleQueue()
+            self._done = self._loop.run_in_executor(
+                self._executor, self._work)
+        future = self._loop.create_future()
+        self._calls.put((future, func, args))
+        return await future
+
+    async def close(self):
+        if self._calls is not None:
+            self._calls.put(None)
+            await self._done
+
+    def _work(self):
+        loop = self._loop
+        while True:
+            call = self._calls.get()
+            if call is None:
+                return
+            future, func, args = call
+            try:
+                result = func(*args)
+            except:  # noqa: E722 do not use bare 'except'
+                loop.call_soon_threadsafe(
+                    _setFutureException, future, sys.exc_info()[1])
+            else:
+                loop.call_soon_threadsafe(_setFutureResult, future, result)
+            call = future = result = None
+
+
+async def publish_async(request, handle_errors=True, executor=None):
+    """Publish `request` from a coroutine.
+
+    This has the same retry and exception semantics as publish().
+    Publication hooks and request methods that are coroutine functions
+    are awaited, as are awaitables returned by the published object.
+    Synchronous hooks are called in one thread of `executor` (or of the
+    default executor of the running loop), which is reserved for the
+    request until it is published.  So unless all hooks are coroutine
+    functions, every request in flight takes a thread, also while its
+    view is awaited.
+
+    Cancelling the coroutine (e.g. with asyncio.timeout) ends and closes
+    the request without handling the CancelledError as an error.
+    """
+    worker = _RequestWorker(asyncio.get_running_loop(), executor)
+    steps = _publish(request, handle_errors, cancellable=True)
+    result = error = None
+    try:
+        while True:
+            try:
+                if error is None:
+                    kind, func, args = steps.send(result)
+                else:
+                    kind, func, args = steps.throw(error)
+            except StopIteration as stop:
+                # Return the request, since it might be a different object
+                # than the one that was passed in.
+                return stop.value
+            result = error = None
+            try:
+                if kind is _SLEEP:
+                    await asyncio.sleep(*args)
+                elif inspect.iscoroutinefunction(func):
+                    result = await func(*args)
+                else:
+                    result = await worker.call(func, *args)
+                if kind is _CALL_OBJECT:
+                    # The object has already been called with the
+                    # permission checks of its proxy, awaiting the
+                    # coroutine it returned doesn't grant more access.
+                    unwrapped = removeAllProxies(result)
+                    if inspect.isawaitable(unwrapped):
+                        result = await unwrapped
+            except:  # noqa: E722 do not use bare 'except'
+                # Handled by _publish().
+                error = sys.exc_info()[1]
+    finally:
+        error = None  # Avoid circular reference.
+        await worker.close()
+
+
 @implementer(IReRaiseException)
 class DoNotReRaiseException:
     """Marker adapter for exceptions that should not be re-raised"""
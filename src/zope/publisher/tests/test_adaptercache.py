@@ -0,0 +1,98 @@
+##############################################################################
+#
+# Copyright (c) Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Adapter lookup cache tests
+"""
+import unittest
+from io import BytesIO
+
+from zope.component import getSiteManager
+from zope.component import provideAdapter
+from zope.component.testing import tearDown
+from zope.interface import Interface
+from zope.interface import implementedBy
+from zope.interface import implementer
+
+from zope.publisher.adaptercache import AdapterLookupCache
+from zope.publisher.http import HTTPRequest
+from zope.publisher.interfaces.http import IResult
+
+
+class IFoo(Interface):
+    pass
+
+
+@implementer(IFoo)
+class Foo:
+
+    def __init__(self, context):
+        self.context = context
+
+
+class AdapterLookupCacheTests(unittest.TestCase):
+
+    def tearDown(self):
+        tearDown()
+
+    def test_lookup_is_cached(self):
+        cache = AdapterLookupCache(IFoo)
+        required = (implementedBy(int),)
+        self.assertIsNone(cache.lookup(int, required))
+        registry = getSiteManager().adapters
+        self.assertEqual(cache._registries[registry][1], {int: None})
+
+    def test_registry_changes_invalidate(self):
+        cache = AdapterLookupCache(IFoo)
+        required = (implementedBy(int),)
+        self.assertIsNone(cache.lookup(int, required))
+        provideAdapter(Foo, (int,), IFoo)
+        self.assertIs(cache.lookup(int, required), Foo)
+        getSiteManager().unregisterAdapter(Foo, (int,), IFoo)
+        self.assertIsNone(cache.lookup(int, required))
+
+    def test_clear(self):
+        cache = AdapterLookupCache(IFoo)
+        cache.lookup(int, (implementedBy(int),))
+        cache.clear()
+        self.assertEqual(len(cache._registries), 0)
+
+
+class ResultAdapterTests(unittest.TestCase):
+
+    def tearDown(self):
+        tearDown()
+
+    def _setResult(self, result):
+        request = HTTPRequest(BytesIO(b''), {})
+        request.response.setResult(result)
+        return request.response.consumeBody()
+
+    def test_str_result_without_adapter(self):
+        self.assertEqual(self._setResult(b'spam'), b'spam')
+
+    def test_registered_adapter_overrides_builtin_handling(self):
+        self.assertEqual(self._setResult(b'spam'), b'spam')
+
+        def shout(result, request):
+            return [result.upper()]
+
+        provideAdapter(shout, (bytes, HTTPRequest), IResult)
+        self.assertEqual(self._setResult(b'spam'), b'SPAM')
+
+
+def test_suite():
+    return unittest.TestSuite((
+        unittest.defaultTestLoader.loadTestsFromTestCase(
+            AdapterLookupCacheTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(ResultAdapterTests),
+    ))
@@ -0,0 +1,225 @@
+##############################################################################
+#
+# Copyright (c) Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""ASGI application tests
+"""
+import asyncio
+import io
+import tempfile
+import unittest
+
+from zope.component import provideAdapter
+from zope.component.testing import tearDown
+
+from zope.publisher.asgi import Application
+from zope.publisher.asgi import scope_to_environ
+from zope.publisher.http import HTTPCharsets
+
+
+def http_scope(method='GET', path='/a/b', query_string=b'', headers=()):
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'root_path': '',
+        'query_string': query_string,
+        'headers': list(headers),
+        'server': ('example.com', 8080),
+        'client': ('10.0.0.1', 12345),
+    }
+
+
+class ApplicationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Application(dict(global_option=42),
+                               publication='egg:zope.publisher#sample',
+                               threads='2')
+        provideAdapter(HTTPCharsets)
+
+    def tearDown(self):
+        if self.app._executor is not None:
+            self.app._executor.shutdown()
+        tearDown()
+
+    def _call(self, scope, body_chunks=(b'',)):
+        incoming = [{'type': 'http.request', 'body': chunk,
+                     'more_body': i < len(body_chunks) - 1}
+                    for i, chunk in enumerate(body_chunks)]
+        sent = []
+
+        async def receive():
+            return incoming.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(self.app(scope, receive, send))
+        return sent
+
+    def test_get(self):
+        sent = self._call(http_scope())
+        start = sent[0]
+        self.assertEqual(start['type'], 'http.response.start')
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'Content-Type', b'text/html;charset=utf-8'),
+                      start['headers'])
+        body = b''.join(m['body'] for m in sent[1:])
+        self.assertIn(b'<h1>BrowserRequest</h1>', body)
+        self.assertIn(b'PATH_INFO:\t/a/b', body)
+        self.assertIn(b'SERVER_NAME:\texample.com', body)
+        self.assertEqual(sent[-1], {'type': 'http.response.body',
+                                    'body': b''})
+
+    def test_streamed_request_body(self):
+        scope = http_scope(
+            'POST',
+            headers=[(b'content-type', b'application/x-www-form-urlencoded'),
+                     (b'content-length', b'13')])
+        sent = self._call(scope, [b'spam=1', b'&eggs=', b'2'])
+        body = b''.join(m['body'] for m in sent[1:])
+        self.assertIn(b'spam:\t1', body)
+        self.assertIn(b'eggs:\t2', body)
+
+    def test_streamed_response_body(self):
+        class Body:
+            closed = False
+
+            def __iter__(self):
+                yield b'first'
+                yield 'second'
+
+            def close(self):
+                self.closed = True
+
+        body = Body()
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        async def run():
+            await self.app._sendBody(asyncio.get_running_loop(), body, send)
+
+        asyncio.run(run())
+        self.assertEqual([m['body'] for m in sent],
+                         [b'first', b'second', b''])
+        self.assertTrue(body.closed)
+
+    def _sendFile(self, body):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        async def run():
+            await self.app._sendFile(asyncio.get_running_loop(), body, send)
+
+        asyncio.run(run())
+        return sent
+
+    def test_zerocopysend(self):
+        from zope.publisher.http import FileResult
+        file = tempfile.TemporaryFile()
+        file.write(b'0123456789')
+        file.flush()
+        body = FileResult(file, offset=2, length=5)
+        sent = self._sendFile(body)
+        self.assertEqual(sent, [{'type': 'http.response.zerocopysend',
+                                 'file': body.file,
+                                 'offset': 2,
+                                 'count': 5}])
+        self.assertTrue(body.file.closed)
+
+    def test_zerocopysend_without_descriptor(self):
+        from zope.publisher.http import FileResult
+        body = FileResult(io.BytesIO(b'0123456789'), offset=2, length=5)
+        sent = self._sendFile(body)
+        self.assertEqual(sent, [{'type': 'http.response.body',
+                                 'body': b'23456',
+                                 'more_body': True},
+                                {'type': 'http.response.body',
+                                 'body': b''}])
+        self.assertTrue(body.file.closed)
+
+    def test_lifespan(self):
+        incoming = [{'type': 'lifespan.startup'},
+                    {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return incoming.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(self.app({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, [{'type': 'lifespan.startup.complete'},
+                                {'type': 'lifespan.shutdown.complete'}])
+
+    def test_unsupported_scope(self):
+        self.assertRaises(ValueError, asyncio.run,
+                          self.app({'type': 'websocket'}, None, None))
+
+
+class ScopeToEnvironTests(unittest.TestCase):
+
+    def test_environ(self):
+        scope = http_scope(
+            path='/caf\xe9', query_string=b'x=1',
+            headers=[(b'host', b'example.com'),
+                     (b'accept', b'text/html'),
+                     (b'accept', b'text/plain'),
+                     (b'content-type', b'text/plain')])
+        scope['scheme'] = 'https'
+        environ = scope_to_environ(scope, None)
+        self.assertEqual(environ['PATH_INFO'].encode('latin-1'),
+                         '/caf\xe9'.encode())
+        self.assertEqual(environ['QUERY_STRING'], 'x=1')
+        self.assertEqual(environ['HTTP_HOST'], 'example.com')
+        self.assertEqual(environ['HTTP_ACCEPT'], 'text/html,text/plain')
+        self.assertEqual(environ['CONTENT_TYPE'], 'text/plain')
+        self.assertEqual(environ['SERVER_PORT'], '8080')
+        self.assertEqual(environ['REMOTE_ADDR'], '10.0.0.1')
+        self.assertEqual(environ['HTTPS'], 'on')
+
+    def test_cookies(self):
+        scope = http_scope(headers=[(b'cookie', b'a=1'),
+                                    (b'cookie', b'b=2')])
+        environ = scope_to_environ(scope, None)
+        self.assertEqual(environ['HTTP_COOKIE'], 'a=1; b=2')
+
+    def test_root_path(self):
+        scope = http_scope(path='/app/a/b')
+        scope['root_path'] = '/app'
+        environ = scope_to_environ(scope, None)
+        self.assertEqual(environ['SCRIPT_NAME'], '/app')
+        self.assertEqual(environ['PATH_INFO'], '/a/b')
+
+        scope['path'] = '/app'
+        self.assertEqual(scope_to_environ(scope, None)['PATH_INFO'], '')
+
+        # Paths which aren't below the root path are left alone.
+        scope['path'] = '/application'
+        self.assertEqual(scope_to_environ(scope, None)['PATH_INFO'],
+                         '/application')
+
+
+def test_suite():
+    return unittest.TestSuite((
+        unittest.defaultTestLoader.loadTestsFromTestCase(ApplicationTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(ScopeToEnvironTests),
+    ))
@@ -58,6 +58,13 @@ class BrowserLanguagesTest(unittest.TestCase):
             self.assertEqual(list(browser_languages.getPreferredLanguages()),
                              expected)
 
+    def test_parsed_headers_are_shared(self):
+        first = self.factory(TestRequest("da, en;q=0.5, pt"))
+        second = self.factory(TestRequest("da, en;q=0.5, pt"))
+        languages = first.getPreferredLanguages()
+        self.assertEqual(languages, ("da", "pt", "en"))
+        self.assertIs(second.getPreferredLanguages(), languages)
+
 
 class CacheableBrowserLanguagesTests(BrowserLanguagesTest):
 
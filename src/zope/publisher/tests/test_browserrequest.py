@@ -167,12 +167,26 @@ class BrowserTests(HTTPTests):
             res,
             "Status: 200 Ok\r\n"
             "X-Powered-By: Zope (www.zope.org), Python (www.python.org)\r\n"
-            "Content-Length: 6\r\n"
-            "Content-Type: text/plain;charset=utf-8\r\n"
             "X-Content-Type-Warning: guessed from content\r\n"
+            "Content-Type: text/plain;charset=utf-8\r\n"
+            "Content-Length: 6\r\n"
             "\r\n"
             "'5', 6")
 
+    def testTraversalToItemSortedHeaders(self):
+        from zope.publisher.http import HTTPResponse
+        HTTPResponse.sort_headers = True
+        self.addCleanup(setattr, HTTPResponse, 'sort_headers', False)
+        request = self._createRequest()
+        publish(request)
+        self.assertEqual(
+            request.response.getHeaders(),
+            [('X-Powered-By',
+              'Zope (www.zope.org), Python (www.python.org)'),
+             ('Content-Length', '6'),
+             ('Content-Type', 'text/plain;charset=utf-8'),
+             ('X-Content-Type-Warning', 'guessed from content')])
+
     def testNoDefault(self):
         request = self._createRequest()
         response = request.response
@@ -585,6 +599,30 @@ class BrowserTests(HTTPTests):
         request = self._createRequest(extra)
         self.assertRaises(ValueError, publish, request)
 
+    def testFormKeyPlans(self):
+        from zope.publisher.browser import _key_plan
+        _key_plan.cache_clear()
+        for i in range(2):
+            request = self._createRequest(
+                {'QUERY_STRING': 'a:int:list=5&a:int:list=6'})
+            request.processInputs()
+            self.assertEqual(request.form, {'a': [5, 6]})
+        self.assertEqual(_key_plan.cache_info().misses, 1)
+
+    def testRegisterTypeConverterInvalidatesKeyPlans(self):
+        from zope.publisher import browser
+        self.addCleanup(browser.type_converters.pop, 'upper', None)
+        self.addCleanup(browser._key_plan.cache_clear)
+        extra = {'QUERY_STRING': 'a:upper=spam'}
+        request = self._createRequest(extra)
+        request.processInputs()
+        self.assertEqual(request.form, {'a': 'spam'})
+
+        browser.registerTypeConverter('upper', str.upper)
+        request = self._createRequest(extra)
+        request.processInputs()
+        self.assertEqual(request.form, {'a': 'SPAM'})
+
     def testFormFloatTypes(self):
         extra = {'QUERY_STRING': 'a:float=5&b:float=-5.01&c:float=0'}
         request = self._createRequest(extra)
@@ -758,6 +796,207 @@ class BrowserTests(HTTPTests):
 
 
 @implementer(IBrowserPublication)
+class IncrementalTestBrowserRequest(TestBrowserRequest):
+    incremental_multipart = True
+
+
+class IncrementalMultipartBrowserTests(BrowserTests):
+    """Run the browser request tests parsing multipart bodies incrementally.
+    """
+
+    def _createRequest(self, extra_env={}, body=b"",
+                       request_class=IncrementalTestBrowserRequest):
+        env = self._testEnv.copy()
+        env.update(extra_env)
+        if len(body):
+            env['CONTENT_LENGTH'] = str(len(body))
+
+        request = request_class(BytesIO(body), env)
+        request.setPublication(Publication(self.app))
+        return request
+
+    _upload = {
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_TYPE': 'multipart/form-data; boundary=-123',
+    }
+    _upload_body = (b'---123\r\n'
+                    b'Content-Disposition: form-data; name="x:int"\r\n'
+                    b'\r\n'
+                    b'1\r\n'
+                    b'---123\r\n'
+                    b'Content-Disposition: form-data; name="upload";'
+                    b' filename="data.bin"\r\n'
+                    b'Content-Type: application/octet-stream\r\n'
+                    b'\r\n'
+                    b'0123456789\r\n'
+                    b'---123--\r\n')
+
+    def testUploadSink(self):
+        sinks = []
+
+        class SinkRequest(IncrementalTestBrowserRequest):
+            def getUploadSink(self, name, filename, headers):
+                if filename:
+                    sink = BytesIO()
+                    sinks.append((name, filename, headers, sink))
+                    return sink
+
+        request = self._createRequest(self._upload, self._upload_body,
+                                      request_class=SinkRequest)
+        request.processInputs()
+        [(name, filename, headers, sink)] = sinks
+        self.assertEqual((name, filename), ('upload', 'data.bin'))
+        self.assertIn(('Content-Type', 'application/octet-stream'), headers)
+        self.assertIs(request.form['upload'], sink)
+        self.assertEqual(sink.getvalue(), b'0123456789')
+        self.assertEqual(request.form['x'], 1)
+
+    def testBodyCachedForRetries(self):
+        request = self._createRequest(self._upload, self._upload_body)
+        request.processInputs()
+        cache = request._body_instream.cacheStream
+        self.assertEqual(cache.getvalue(), self._upload_body)
+
+        class NoRetryRequest(IncrementalTestBrowserRequest):
+            retry_max_count = 0
+
+        request = self._createRequest(self._upload, self._upload_body,
+                                      request_class=NoRetryRequest)
+        request.processInputs()
+        self.assertIsNone(request._body_instream.cacheStream)
+        self.assertEqual(request.form['x'], 1)
+
+    def testMalformedHeaders(self):
+        # Like multipart.parse_form_data, the form is left empty.
+        for extra in ({'CONTENT_TYPE': 'multipart/form-data'},
+                      {'CONTENT_TYPE':
+                       'multipart/form-data; boundary=-123; charset=bogus'},
+                      {'CONTENT_LENGTH': 'spam'}):
+            env = dict(self._upload, **extra)
+            request = self._createRequest(env, self._upload_body)
+            if 'CONTENT_LENGTH' in extra:
+                request._environ['CONTENT_LENGTH'] = extra['CONTENT_LENGTH']
+            request.processInputs()
+            self.assertEqual(dict(request.form), {})
+
+    def testMemoryLimit(self):
+        class LimitedRequest(IncrementalTestBrowserRequest):
+            multipart_memory_limit = 5
+
+        request = self._createRequest(
+            self._upload,
+            self._upload_body.replace(b'1\r\n', b'123456\r\n'),
+            request_class=LimitedRequest)
+        request.processInputs()
+        self.assertEqual(dict(request.form), {})
+
+    def testUploadSinkAbortedOnError(self):
+        class Sink(BytesIO):
+            aborted = False
+
+            def abort(self):
+                self.aborted = True
+
+        sinks = []
+
+        class SinkRequest(IncrementalTestBrowserRequest):
+            def getUploadSink(self, name, filename, headers):
+                if filename:
+                    sink = Sink()
+                    sinks.append(sink)
+                    return sink
+
+        truncated = self._upload_body[:-len(b'789\r\n---123--\r\n')]
+        request = self._createRequest(self._upload, truncated,
+                                      request_class=SinkRequest)
+        request.processInputs()
+        [sink] = sinks
+        self.assertTrue(sink.aborted)
+        self.assertNotIn('upload', request.form)
+        self.assertEqual(request.form['x'], 1)
+
+    def testSpoolLimit(self):
+        class SpoolingRequest(IncrementalTestBrowserRequest):
+            multipart_spool_limit = 100
+
+        request = self._createRequest(self._upload, self._upload_body,
+                                      request_class=SpoolingRequest)
+        request.processInputs()
+        upload = request.form['upload']
+        self.addCleanup(upload.close)
+        self.assertEqual(upload.filename, 'data.bin')
+        self.assertEqual(upload.read(), b'0123456789')
+
+
+@implementer(IBrowserPublication)
+class LazyTestBrowserRequest(TestBrowserRequest):
+    lazy_form = True
+
+
+class LazyFormBrowserTests(BrowserTests):
+    """Run the browser request tests processing the form on first use.
+    """
+
+    def _createRequest(self, extra_env={}, body=b""):
+        env = self._testEnv.copy()
+        env.update(extra_env)
+        if len(body):
+            env['CONTENT_LENGTH'] = str(len(body))
+
+        request = LazyTestBrowserRequest(BytesIO(body), env)
+        request.setPublication(Publication(self.app))
+        return request
+
+    def test_post_body_not_necessarily(self):
+        request = self._createRequest(
+            dict(REQUEST_METHOD='POST',
+                 CONTENT_TYPE='application/x-www-form-urlencoded',
+                 QUERY_STRING='',
+                 ),
+            b'x=1&y=2')
+        request.processInputs()
+        # The body is only read once the form is used.
+        self.assertEqual(request.bodyStream.read(), b'x=1&y=2')
+
+    def testFormProcessedOnFirstUse(self):
+        for use in (lambda request: request.form,
+                    lambda request: request.get('x'),
+                    lambda request: request.keys()):
+            request = self._createRequest(
+                dict(REQUEST_METHOD='POST',
+                     CONTENT_TYPE='application/x-www-form-urlencoded'),
+                b'x:int=1')
+            request.processInputs()
+            self.assertEqual(request._form, {})
+            use(request)
+            self.assertEqual(request._form, {'x': 1})
+
+    def testSettingFormDiscardsInputs(self):
+        request = self._createRequest({'QUERY_STRING': 'x=1'})
+        request.processInputs()
+        request.form = {'y': '2'}
+        self.assertEqual(request.form, {'y': '2'})
+
+    def testQueryStringMethodBeforeTraversal(self):
+        request = self._createRequest(
+            {'QUERY_STRING': 'a=5&view:method=&b:default_method=',
+             'PATH_INFO': '/folder/item2'})
+        request.processInputs()
+        self.assertEqual(request._path_suffix, ['view'])
+        self.assertEqual(request._form, {})
+        self.assertEqual(request.form, {'a': '5', 'view': '', 'b': ''})
+        self.assertEqual(request._path_suffix, ['view'])
+
+    def testBodyMethodIgnored(self):
+        request = self._createRequest(
+            dict(REQUEST_METHOD='POST', PATH_INFO='/folder/item2'),
+            b'a=5&view:method=')
+        request.processInputs()
+        self.assertIsNone(request._path_suffix)
+        self.assertEqual(request.form, {'a': '5', 'view': ''})
+        self.assertIsNone(request._path_suffix)
+
+
 class TestBrowserPublication(TestPublication):
 
     def getDefaultTraversal(self, request, ob):
@@ -158,6 +158,92 @@ class TestBrowserResponse(TestCase):
             int(response.getHeader('content-length')),
             len(html_page) + len(inserted_text))
 
+    def testStreamingResultInsertsBase(self):
+        from zope.publisher.http import StreamingResult
+        generated = []
+
+        def page():
+            for chunk in ('<html>', '<head><title>t</title>', '</head>',
+                          '<body>\u00dcber</body></html>'):
+                generated.append(chunk)
+                yield chunk
+
+        response = BrowserResponse()
+        response.setBase('http://localhost/folder/')
+        response.setResult(StreamingResult(page()))
+        # Only the first chunk is generated to guess the content type
+        self.assertEqual(generated, ['<html>'])
+        self.assertEqual(response.getHeader('content-type'),
+                         'text/html;charset=utf-8')
+        self.assertEqual(response.getHeader('x-content-type-warning'),
+                         'guessed from content')
+        self.assertIsNone(response.getHeader('content-length'))
+        self.assertEqual(
+            list(response.consumeBodyIter()),
+            [b'<html><head>\n<base href="http://localhost/folder/" />\n'
+             b'<title>t</title></head>',
+             '<body>\u00dcber</body></html>'.encode()])
+
+    def testStreamingResultKeepsBaseInLaterChunk(self):
+        from zope.publisher.http import StreamingResult
+        response = BrowserResponse()
+        response.setBase('http://localhost/folder/')
+        response.setResult(StreamingResult(
+            ['<html><head>', '<base href="http://example.com/" />',
+             '</head>', '<body></body></html>']))
+        self.assertEqual(
+            response.consumeBody(),
+            b'<html><head><base href="http://example.com/" /></head>'
+            b'<body></body></html>')
+
+    def testStreamingResultWithoutHead(self):
+        # Pages without a head are not held back.
+        from zope.publisher.http import StreamingResult
+        generated = []
+
+        def table():
+            yield '<table>'
+            for i in range(1000):
+                generated.append(i)
+                yield '<tr><td>%d</td></tr>' % i
+            yield '</table>'
+
+        response = BrowserResponse()
+        response.setHeader('content-type', 'text/html')
+        response.setBase('http://localhost/folder/')
+        response.setResult(StreamingResult(table()))
+        body = response.consumeBodyIter()
+        first = next(body)
+        self.assertLess(len(generated), 300)
+        self.assertTrue(first.startswith(b'<table><tr><td>0</td></tr>'))
+        self.assertNotIn(b'<base', first + b''.join(body))
+        self.assertEqual(len(generated), 1000)
+
+    def testStreamingResultEncodesBaseWithCharset(self):
+        from zope.publisher.http import StreamingResult
+        response = BrowserResponse()
+        response.setHeader('content-type', 'text/html;charset=latin-1')
+        response.setBase('http://localhost/f\u00fcr/')
+        response.setResult(StreamingResult(
+            ['<html><head></head>', '<body></body></html>']))
+        # The base tag is prepared while publishing, the request may
+        # already be gone when the body is sent.
+        response._request = None
+        self.assertEqual(
+            response.consumeBody(),
+            b'<html><head>\n<base href="http://localhost/f\xfcr/" />\n'
+            b'</head><body></body></html>')
+
+    def testStreamingResultNotHTML(self):
+        from zope.publisher.http import StreamingResult
+        response = BrowserResponse()
+        response.setBase('http://localhost/folder/')
+        response.setHeader('content-type', 'text/csv')
+        response.setResult(StreamingResult(['a,b\n', '<head>\n']))
+        self.assertEqual(response.getHeader('content-type'),
+                         'text/csv;charset=utf-8')
+        self.assertEqual(response.consumeBody(), b'a,b\n<head>\n')
+
     def test_interface(self):
         rp = BrowserResponse()
         verifyObject(IHTTPResponse, rp)
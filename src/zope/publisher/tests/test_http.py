@@ -13,8 +13,10 @@
 ##############################################################################
 """HTTP Publisher Tests
 """
+import os
 import sys
 import tempfile
+import threading
 import unittest
 from doctest import DocFileSuite
 from doctest import DocTestSuite
@@ -31,12 +33,16 @@ from zope.security.proxy import removeSecurityProxy
 
 from zope.publisher.base import DefaultPublication
 from zope.publisher.http import DirectResult
+from zope.publisher.http import FileResult
 from zope.publisher.http import HTTPCharsets
 from zope.publisher.http import HTTPInputStream
 from zope.publisher.http import HTTPRequest
 from zope.publisher.http import HTTPResponse
+from zope.publisher.http import RetryBudget
+from zope.publisher.http import sane_environment
 from zope.publisher.interfaces import IResponse
 from zope.publisher.interfaces import NotFound
+from zope.publisher.interfaces import Retry
 from zope.publisher.interfaces.http import IHTTPApplicationResponse
 from zope.publisher.interfaces.http import IHTTPRequest
 from zope.publisher.interfaces.http import IHTTPResponse
@@ -181,6 +187,85 @@ class HTTPInputStreamTests(unittest.TestCase):
         stream = HTTPInputStream(NonClosingStream(), {})
         self.assertRaises(ServerHung, stream.getCacheStream)
 
+    def testGetCacheStreamAfterPartialRead(self):
+        stream = HTTPInputStream(BytesIO(data),
+                                 {'CONTENT_LENGTH': str(len(data))})
+        self.assertEqual(stream.readline(), b'line 1\n')
+        self.assertEqual(stream.getCacheStream().read(), data)
+
+    def testReadInto(self):
+        stream = HTTPInputStream(BytesIO(data), {})
+        buffer = bytearray(6)
+        self.assertEqual(stream.readinto(buffer), 6)
+        self.assertEqual(buffer, b'line 1')
+        self.assertEqual(self.getCacheStreamValue(stream), b'line 1')
+
+    def testSpillsWithoutContentLength(self):
+        class SmallThresholdStream(HTTPInputStream):
+            spool_threshold = 10
+
+        stream = SmallThresholdStream(BytesIO(data), {})
+        stream.read(5)
+        self.assertIsInstance(stream.cacheStream, BytesIO)
+        stream.read()
+        self.assertIsInstance(stream.cacheStream, TempFileType)
+        try:
+            self.assertEqual(stream.getCacheStream().read(), data)
+        finally:
+            stream.cacheStream.close()
+
+    def testClose(self):
+        stream = HTTPInputStream(BytesIO(data), {})
+        cache = stream.cacheStream
+        stream.close()
+        self.assertTrue(cache.closed)
+        self.assertFalse(stream.stream.closed)
+
+        # The cache handed out for a retry is closed with the stream
+        # reading it.
+        stream = HTTPInputStream(BytesIO(data), {})
+        cache = stream.getCacheStream()
+        stream.close()
+        self.assertFalse(cache.closed)
+        retried = HTTPInputStream(cache, {})
+        retried.closeStream = True
+        retried.close()
+        self.assertTrue(cache.closed)
+
+    def testRequestCloseClosesCache(self):
+        request = HTTPRequest(BytesIO(data), {'CONTENT_LENGTH': '100000'})
+        request.setPublication(DefaultPublication(None))
+        cache = request.bodyStream.cacheStream
+        retried = request.retry()
+        request.close()
+        self.assertFalse(cache.closed)
+        self.assertEqual(retried.bodyStream.read(), data)
+        retried.close()
+        self.assertTrue(cache.closed)
+
+    def testWithoutCache(self):
+        stream = HTTPInputStream(BytesIO(data), {}, cache=False)
+        self.assertIsNone(stream.cacheStream)
+        self.assertEqual(stream.read(), data)
+        self.assertEqual(stream.getCacheStream().read(), b'')
+
+    def testGetCacheStreamWithoutCache(self):
+        # Only the rest of the body is left.
+        stream = HTTPInputStream(
+            BytesIO(data), {'CONTENT_LENGTH': str(len(data))}, cache=False)
+        self.assertEqual(stream.read(10), data[:10])
+        self.assertEqual(stream.getCacheStream().read(), data[10:])
+
+    def testRequestWithoutRetryDoesNotCache(self):
+        class NoRetryRequest(HTTPRequest):
+            retry_max_count = 0
+
+        request = NoRetryRequest(BytesIO(data), {})
+        self.assertIsNone(request.bodyStream.cacheStream)
+        self.assertFalse(request.supportsRetry())
+        request = HTTPRequest(BytesIO(data), {})
+        self.assertIsNotNone(request.bodyStream.cacheStream)
+
 
 class HTTPTests(unittest.TestCase):
 
@@ -457,6 +542,37 @@ class HTTPTests(unittest.TestCase):
         eq(locale.id.territory, None)
         eq(locale.id.variant, None)
 
+    def testRequestLocaleIsLazy(self):
+        from zope.i18n.interfaces import IUserPreferredLanguages
+
+        from zope.publisher.interfaces.http import IHTTPRequest
+
+        calls = []
+
+        class Languages:
+            def __init__(self, request):
+                self.request = request
+
+            def getPreferredLanguages(self):
+                calls.append(self.request)
+                return self.request.annotations.get('langs', ['de'])
+
+        provideAdapter(Languages, [IHTTPRequest], IUserPreferredLanguages)
+        req = self._createRequest()
+        self.assertEqual(calls, [])
+        self.assertEqual(req.locale.id.language, 'de')
+        self.assertIs(req.locale, req.locale)
+        self.assertEqual(len(calls), 1)
+
+        # setupLocale() picks up changed preferences on next access
+        req.annotations['langs'] = ['xx', 'fr']
+        req.setupLocale()
+        self.assertEqual(req.locale.id.language, 'fr')
+
+        # Requests preferring the same languages share the locale
+        self.assertIs(self._createRequest().locale,
+                      self._createRequest().locale)
+
     def testCookies(self):
         cookies = {
             'HTTP_COOKIE':
@@ -482,9 +598,11 @@ class HTTPTests(unittest.TestCase):
             'HTTP_COOKIE':
                 'foo=bar; path=/; spam="eggs"; ldap/OU="Williams"'
         }
+        req = self._createRequest(extra_env=cookies)
+        # Cookies are parsed on first access
         handler = InstalledHandler('eventlog')
         try:
-            req = self._createRequest(extra_env=cookies)
+            req.cookies
         finally:
             handler.uninstall()
 
@@ -512,6 +630,35 @@ class HTTPTests(unittest.TestCase):
         req = self._createRequest(extra_env=cookies)
         self.assertEqual(req.cookies['key'], '\N{BIOHAZARD SIGN}')
 
+    def testCookiesParsedLazily(self):
+        req = self._createRequest(extra_env={'HTTP_COOKIE': 'foo=bar'})
+        self.assertIsNone(req._cookie_data)
+        self.assertEqual(req.get('foo'), 'bar')
+        self.assertEqual(req._cookie_data, {'foo': 'bar'})
+
+        req = self._createRequest()
+        req._cookies = {'spam': 'eggs'}
+        self.assertEqual(req.getCookies(), {'spam': 'eggs'})
+
+    def testCookiesCachedByHeader(self):
+        header = 'session=abc123; theme=dark'
+        first = self._createRequest(extra_env={'HTTP_COOKIE': header})
+        second = self._createRequest(extra_env={'HTTP_COOKIE': header})
+        self.assertEqual(first.cookies['session'], 'abc123')
+        self.assertEqual(second.cookies['theme'], 'dark')
+        # Every request gets its own copy of the cached result
+        self.assertIsNot(first.getCookies(), second.getCookies())
+
+    def testCookieParserMatchesSimpleCookie(self):
+        from http.cookies import SimpleCookie
+
+        from zope.publisher.http import parse_cookie_header
+        for header in ('a=b; c=d', 'a=b;', 'a=b;;c=d', ' a = b ; c=[x]',
+                       'a=b=c', 'a=', 'a=b; Path=/; c=d', '$Version=1; a=b',
+                       'a=b c=d', 'a=b;c', 'a="x;y"; b=c'):
+            expected = {k: v.value for k, v in SimpleCookie(header).items()}
+            self.assertEqual(parse_cookie_header(header), expected, header)
+
     def testHeaders(self):
         headers = {
             'TEST_HEADER': 'test',
@@ -692,6 +839,37 @@ class HTTPTests(unittest.TestCase):
         self.assertEqual(req['PATH_INFO'],
                          '/\u00e4\u00f6/\u00fc\u00df/foo/bar.html')
 
+    def testURLsFollowTraversal(self):
+        req = self._createRequest({'PATH_INFO': '/\xc3\xa4/b c/d'})
+        self.assertEqual(req.getURL(), 'http://foobar.com')
+        req._traversed_names.append('\u00e4')
+        self.assertEqual(req.getURL(), 'http://foobar.com/%C3%A4')
+        req._traversed_names.extend(['b c', 'd'])
+        self.assertEqual(req.getURL(), 'http://foobar.com/%C3%A4/b%20c/d')
+        self.assertEqual(req.getURL(1, path_only=True), '/%C3%A4/b%20c')
+        self.assertEqual(req.URL[-3], 'http://foobar.com')
+        self.assertEqual(req.URL[2], 'http://foobar.com/%C3%A4/b%20c')
+        self.assertEqual(req.getApplicationURL(-1), req.URL[2])
+        self.assertRaises(IndexError, req.getURL, 4)
+        self.assertRaises(IndexError, req.getApplicationURL, 4)
+
+    def testURLsInvalidatedByVirtualHosting(self):
+        req = self._createRequest()
+        req._traversed_names.extend(['a', 'b'])
+        self.assertEqual(req.getURL(), 'http://foobar.com/a/b')
+        self.assertEqual(req.getApplicationURL(), 'http://foobar.com')
+
+        req.setApplicationServer('example.com', proto='https')
+        self.assertEqual(req.getURL(), 'https://example.com/a/b')
+
+        req.setVirtualHostRoot(['x'])
+        self.assertEqual(req.getURL(), 'https://example.com/x')
+        req._traversed_names.append('c')
+        req.shiftNameToApplication()
+        self.assertEqual(req.getApplicationURL(path_only=True), '/x/c')
+        req._traversed_names.append('d')
+        self.assertEqual(req.getURL(), 'https://example.com/x/c/d')
+
     def testResponseWriteFaile(self):
         self.assertRaises(TypeError,
                           self._createRequest().response.write,
@@ -781,6 +959,349 @@ class ConcreteHTTPTests(HTTPTests):
         # assert that our mock was used
         self.assertEqual(len(call_log), 1)
 
+    def test_charsets_negotiated_once(self):
+        from zope.i18n.interfaces import IUserPreferredCharsets
+
+        from zope.publisher.http import getCharsetsUsingRequest
+        from zope.publisher.http import getCharsetUsingRequest
+        request = self._createRequest({'HTTP_ACCEPT_CHARSET': 'ISO-8859-1'})
+        calls = []
+
+        class Charsets(HTTPCharsets):
+            def getPreferredCharsets(self):
+                calls.append(self.request)
+                return super().getPreferredCharsets()
+
+        provideAdapter(Charsets, provides=IUserPreferredCharsets)
+        self.assertEqual(getCharsetsUsingRequest(request),
+                         ('iso-8859-1',))
+        self.assertEqual(getCharsetUsingRequest(request), 'iso-8859-1')
+        self.assertEqual(calls, [request])
+
+
+class RetryTests(unittest.TestCase):
+
+    def _createRequest(self, budget=None, **kw):
+        attrs = dict(retry_budget=budget or RetryBudget(), **kw)
+        request_class = type('RetryingRequest', (HTTPRequest,), attrs)
+        return request_class(BytesIO(b''), {'PATH_INFO': '/conflict'})
+
+    def test_unlimited_budget_counts_retries(self):
+        request = self._createRequest()
+        budget = request.retry_budget
+        self.assertIs(request.supportsRetry(), True)
+        self.assertIs(request.acquireRetry(), True)
+        self.assertEqual(budget.retries, 1)
+        self.assertEqual(budget.suppressed, 0)
+
+    def test_exhausted_budget_suppresses_retries(self):
+        budget = RetryBudget(rate=0.001, capacity=1)
+        request = self._createRequest(budget)
+        self.assertTrue(request.supportsRetry())
+        self.assertTrue(request.acquireRetry())
+        # The budget decides when the retry is acquired, asking
+        # supportsRetry doesn't count as a refused retry.
+        self.assertIs(request.supportsRetry(), True)
+        self.assertIs(request.supportsRetry(), True)
+        self.assertIs(request.acquireRetry(), False)
+        self.assertEqual((budget.retries, budget.suppressed), (1, 1))
+
+    def test_supportsRetry_after_max_count(self):
+        request = self._createRequest()
+        request._retry_count = request.retry_max_count
+        self.assertIs(request.supportsRetry(), False)
+
+    def test_try_acquire_is_atomic(self):
+        budget = RetryBudget(rate=0.001, capacity=50)
+        barrier = threading.Barrier(8)
+        acquired = []
+
+        def worker():
+            barrier.wait()
+            acquired.extend(budget.try_acquire() for i in range(20))
+
+        threads = [threading.Thread(target=worker) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(acquired.count(True), 50)
+        self.assertEqual((budget.retries, budget.suppressed), (50, 110))
+
+    def test_budget_refills(self):
+        budget = RetryBudget(rate=1000, capacity=1)
+        self.assertTrue(budget.try_acquire())
+        budget._updated -= 1
+        self.assertTrue(budget.available())
+        self.assertEqual(budget.tokens, 1)
+
+    def test_no_backoff_by_default(self):
+        self.assertEqual(self._createRequest().getRetryDelay(), 0)
+
+    def test_backoff_with_jitter(self):
+        request = self._createRequest(retry_backoff=0.1,
+                                      retry_backoff_max=0.3)
+        for count, limit in ((0, 0.1), (1, 0.2), (2, 0.3), (5, 0.3)):
+            request._retry_count = count
+            for i in range(20):
+                delay = request.getRetryDelay()
+                self.assertGreaterEqual(delay, 0)
+                self.assertLessEqual(delay, limit)
+
+    def test_publish_backs_off(self):
+        class App:
+            """Required docstring for the publisher."""
+
+            def conflict(self):
+                """Required docstring for the publisher."""
+                raise ValueError('conflict')
+
+        class RetryPublication(DefaultPublication):
+            def handleException(self, object, request, exc_info,
+                                retry_allowed=1):
+                if retry_allowed and request.supportsRetry():
+                    raise Retry(exc_info)
+                super().handleException(object, request, exc_info)
+
+        budget = RetryBudget()
+        request = self._createRequest(budget, retry_backoff=0.001)
+        request.setPublication(RetryPublication(App()))
+        publish(request)
+        self.assertEqual(budget.retries, request.retry_max_count)
+        self.assertEqual(budget.suppressed, 0)
+
+    def test_publish_with_exhausted_budget(self):
+        class App:
+            """Required docstring for the publisher."""
+
+            def conflict(self):
+                """Required docstring for the publisher."""
+                raise ValueError('conflict')
+
+        class RetryPublication(DefaultPublication):
+            def handleException(self, object, request, exc_info,
+                                retry_allowed=1):
+                if retry_allowed and request.supportsRetry():
+                    raise Retry(exc_info)
+                super().handleException(object, request, exc_info)
+
+        budget = RetryBudget(rate=0.001, capacity=1)
+        request = self._createRequest(budget)
+        request.setPublication(RetryPublication(App()))
+        self.assertRaises(ValueError, publish, request, handle_errors=False)
+        # The second retry was refused by the budget.
+        self.assertEqual((budget.retries, budget.suppressed), (1, 1))
+
+        request = self._createRequest(budget)
+        request.setPublication(RetryPublication(App()))
+        publish(request)
+        self.assertEqual(request.response.getStatus(), 500)
+        self.assertEqual((budget.retries, budget.suppressed), (1, 2))
+
+
+class SaneEnvironmentTests(unittest.TestCase):
+
+    def test_redirect_prefixes(self):
+        env = {'REDIRECT_SPAM': 'old', 'EGGS': 'eggs',
+               'REDIRECT_REDIRECT_HAM': 'ham',
+               'REDIRECT_EGGS': 'redirected'}
+        sane = sane_environment(env)
+        self.assertEqual(sane, {'SPAM': 'old', 'HAM': 'ham',
+                                'EGGS': 'redirected'})
+
+    def test_without_redirects(self):
+        env = {'SPAM': 'spam', 'PATH_INFO': '/foo'}
+        sane = sane_environment(env)
+        self.assertEqual(sane, env)
+        self.assertIsNot(sane, env)
+        # Keys merely containing REDIRECT_ are left alone.
+        env = {'HTTP_X_REDIRECT_TO': '/spam', 'PATH_INFO': '/foo'}
+        self.assertEqual(sane_environment(env), env)
+
+    def test_cgi_authorization(self):
+        sane = sane_environment({'HTTP_CGI_AUTHORIZATION': 'Basic abc'})
+        self.assertEqual(sane, {'HTTP_AUTHORIZATION': 'Basic abc'})
+
+    def test_path_info_is_recoded(self):
+        path = '/caf\xe9'.encode().decode('latin1')
+        sane = sane_environment({'PATH_INFO': path})
+        self.assertEqual(sane['PATH_INFO'], '/caf\xe9')
+
+    def test_request_keeps_original_environment(self):
+        env = {'PATH_INFO': '/foo', 'HTTP_AUTHORIZATION': 'Basic abc'}
+        request = HTTPRequest(BytesIO(b''), env)
+        self.assertEqual(env, {'PATH_INFO': '/foo',
+                               'HTTP_AUTHORIZATION': 'Basic abc'})
+        self.assertIsNone(request.get('HTTP_AUTHORIZATION'))
+        self.assertEqual(request._auth, 'Basic abc')
+        request.setPublication(DefaultPublication(None))
+        self.assertEqual(request.retry()._auth, 'Basic abc')
+
+
+class FileResultTests(unittest.TestCase):
+
+    def setUp(self):
+        self.file = tempfile.NamedTemporaryFile(delete=False)
+        self.addCleanup(os.unlink, self.file.name)
+        self.file.write(b'0123456789' * 10000)
+        self.file.close()
+        os.utime(self.file.name, (0, 784111777))
+
+    def _setResult(self, result):
+        response = HTTPResponse()
+        response.setResult(result)
+        return response
+
+    def test_whole_file(self):
+        result = FileResult(self.file.name)
+        response = self._setResult(result)
+        self.assertEqual(response.getStatus(), 200)
+        self.assertEqual(response.getHeader('content-length'), '100000')
+        self.assertEqual(response.getHeader('last-modified'),
+                         'Sun, 06 Nov 1994 08:49:37 GMT')
+        self.assertTrue(result.extendsToEnd())
+        self.assertEqual(response.consumeBody(), b'0123456789' * 10000)
+        self.assertTrue(result.file.closed)
+
+    def test_part_of_file(self):
+        with open(self.file.name, 'rb') as f:
+            result = FileResult(f, offset=5, length=10)
+            response = self._setResult(result)
+            self.assertEqual(response.getHeader('content-length'), '10')
+            self.assertFalse(result.extendsToEnd())
+            self.assertEqual(response.consumeBody(), b'5678901234')
+
+    def test_length_is_clamped(self):
+        result = FileResult(self.file.name, offset=99995, length=100)
+        self.assertEqual(result.length, 5)
+        self.assertTrue(result.extendsToEnd())
+        result.close()
+
+    def test_file_without_descriptor(self):
+        from datetime import datetime
+        from datetime import timezone
+        modified = datetime(1994, 11, 6, 8, 49, 37, tzinfo=timezone.utc)
+        result = FileResult(BytesIO(b'spam'), last_modified=modified)
+        response = self._setResult(result)
+        self.assertEqual(response.getHeader('content-length'), '4')
+        self.assertEqual(response.getHeader('last-modified'),
+                         'Sun, 06 Nov 1994 08:49:37 GMT')
+        self.assertEqual(response.consumeBody(), b'spam')
+
+
+class FileResultNegotiationTests(unittest.TestCase):
+
+    last_modified = 'Sun, 06 Nov 1994 08:49:37 GMT'
+
+    def _publish(self, method='GET', **headers):
+        env = {'REQUEST_METHOD': method}
+        for name, value in headers.items():
+            env['HTTP_' + name.upper()] = value
+        request = HTTPRequest(BytesIO(b''), env)
+        response = request.response
+        response.setHeader('content-type', 'text/plain')
+        result = FileResult(BytesIO(b'0123456789'), last_modified=784111777)
+        response.setResult(result)
+        return response, result
+
+    def test_validators(self):
+        response, result = self._publish()
+        self.assertEqual(response.getStatus(), 200)
+        self.assertEqual(response.getHeader('accept-ranges'), 'bytes')
+        self.assertEqual(response.getHeader('etag'), '"2ebc98a1-0-a"')
+        self.assertEqual(response.getHeader('last-modified'),
+                         self.last_modified)
+        self.assertEqual(response.consumeBody(), b'0123456789')
+
+    def test_if_none_match(self):
+        response, result = self._publish(
+            if_none_match='"other", W/"2ebc98a1-0-a"')
+        self.assertEqual(response.getStatus(), 304)
+        self.assertIsNone(response.getHeader('content-length'))
+        self.assertEqual(response.consumeBody(), b'')
+        self.assertTrue(result.file.closed)
+
+        response, result = self._publish(if_none_match='"other"',
+                                         if_modified_since=self.last_modified)
+        self.assertEqual(response.getStatus(), 200)
+
+    def test_if_modified_since(self):
+        response, result = self._publish(if_modified_since=self.last_modified)
+        self.assertEqual(response.getStatus(), 304)
+
+        response, result = self._publish(
+            if_modified_since='Sun, 06 Nov 1994 08:49:36 GMT')
+        self.assertEqual(response.getStatus(), 200)
+
+        response, result = self._publish(if_modified_since='garbage')
+        self.assertEqual(response.getStatus(), 200)
+
+    def test_conditions_only_for_get_and_head(self):
+        response, result = self._publish(
+            'POST', if_modified_since=self.last_modified, range='bytes=0-1')
+        self.assertEqual(response.getStatus(), 200)
+        self.assertEqual(response.getHeader('content-length'), '10')
+
+    def test_single_range(self):
+        response, result = self._publish(range='bytes=2-4')
+        self.assertEqual(response.getStatus(), 206)
+        self.assertEqual(response.getHeader('content-range'), 'bytes 2-4/10')
+        self.assertEqual(response.getHeader('content-length'), '3')
+        self.assertEqual(response.getHeader('content-type'), 'text/plain')
+        self.assertEqual(response.consumeBody(), b'234')
+
+        response, result = self._publish(range='bytes=-3')
+        self.assertEqual(response.getHeader('content-range'), 'bytes 7-9/10')
+        self.assertEqual(response.consumeBody(), b'789')
+
+        response, result = self._publish(range='bytes=8-')
+        self.assertEqual(response.consumeBody(), b'89')
+
+    def test_multiple_ranges(self):
+        response, result = self._publish(range='bytes=0-1, 5-6, 6-7')
+        self.assertEqual(response.getStatus(), 206)
+        content_type = response.getHeader('content-type')
+        self.assertTrue(
+            content_type.startswith('multipart/byteranges; boundary='))
+        boundary = content_type.split('=')[1]
+        body = response.consumeBody()
+        self.assertEqual(int(response.getHeader('content-length')),
+                         len(body))
+        self.assertEqual(body.decode('latin-1'), (
+            '--{0}\r\n'
+            'Content-Type: text/plain\r\n'
+            'Content-Range: bytes 0-1/10\r\n\r\n'
+            '01\r\n'
+            '--{0}\r\n'
+            'Content-Type: text/plain\r\n'
+            'Content-Range: bytes 5-7/10\r\n\r\n'
+            '567\r\n'
+            '--{0}--\r\n').format(boundary))
+        self.assertTrue(result.file.closed)
+
+    def test_unsatisfiable_range(self):
+        response, result = self._publish(range='bytes=10-20')
+        self.assertEqual(response.getStatus(), 416)
+        self.assertEqual(response.getHeader('content-range'), 'bytes */10')
+        self.assertEqual(response.consumeBody(), b'')
+
+    def test_invalid_ranges_are_ignored(self):
+        for header in ('bytes=5-2', 'items=0-1', 'bytes=a-b', 'bytes=-',
+                       'bytes=' + ','.join(['0-0'] * 21)):
+            response, result = self._publish(range=header)
+            self.assertEqual(response.getStatus(), 200, header)
+            self.assertEqual(response.consumeBody(), b'0123456789')
+
+    def test_if_range(self):
+        for if_range, status in (('"2ebc98a1-0-a"', 206),
+                                 ('"other"', 200),
+                                 ('W/"2ebc98a1-0-a"', 200),
+                                 (self.last_modified, 206),
+                                 ('Sun, 06 Nov 1994 08:49:38 GMT', 200)):
+            response, result = self._publish(range='bytes=0-1',
+                                             if_range=if_range)
+            self.assertEqual(response.getStatus(), status, if_range)
+
 
 class TestHTTPResponse(unittest.TestCase):
 
@@ -988,6 +1509,39 @@ class TestHTTPResponse(unittest.TestCase):
         self.assertTrue('foo=bar;' in c or 'foo=bar' in c)
         self.assertNotIn('secure', c)
 
+    def testSetCookieMatchesSimpleCookie(self):
+        from zope.publisher.http import _set_cookie_value
+        from zope.publisher.http import _simple_cookie_value
+        for name, value, kw in [
+                ('foo', 'bar', {}),
+                ('foo', 'bar', {'path': '/', 'domain': 'example.com',
+                                'max_age': 3600, 'secure': True,
+                                'httponly': True, 'samesite': 'Lax'}),
+                ('foo', 'bar', {'expires': 'Sat, 12 Jul 2014 23:26:28 GMT',
+                                'path': '', 'secure': False}),
+                ('foo', 'a b', {}),
+                ('foo', '', {}),
+                ('foo', 'bar', {'comment': 'blah'}),
+                ('sign', '\N{BIOHAZARD SIGN}', {})]:
+            response = self._createResponse()
+            response.setCookie(name, value, **kw)
+            attrs = response.getCookie(name)
+            self.assertEqual(
+                response.getHeaders()[-1],
+                ('Set-Cookie', _simple_cookie_value(name, attrs)))
+            direct = _set_cookie_value(name, attrs)
+            if ' ' in value or not value.isascii() or 'comment' in kw:
+                self.assertIsNone(direct)
+            elif value:
+                self.assertEqual(direct, _simple_cookie_value(name, attrs))
+
+    def testSetCookieOrder(self):
+        c = self._getCookieFromResponse([
+            ('foo', 'bar', {}),
+            ('alpha', 'beta', {'path': '/'}),
+        ])
+        self.assertEqual(c, ['alpha=beta; Path=/', 'foo=bar'])
+
     def test_handleException(self):
         response = HTTPResponse()
         try:
@@ -1072,6 +1626,12 @@ def test_suite():
     return unittest.TestSuite((
         unittest.defaultTestLoader.loadTestsFromTestCase(ConcreteHTTPTests),
         unittest.defaultTestLoader.loadTestsFromTestCase(TestHTTPResponse),
+        unittest.defaultTestLoader.loadTestsFromTestCase(FileResultTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(
+            FileResultNegotiationTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(RetryTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(
+            SaneEnvironmentTests),
         unittest.defaultTestLoader.loadTestsFromTestCase(HTTPInputStreamTests),
         DocTestSuite('zope.publisher.http'),
         DocFileSuite('../httpresults.txt',
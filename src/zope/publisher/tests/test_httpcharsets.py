@@ -92,6 +92,18 @@ class HTTPCharsetTest(unittest.TestCase):
         self.assertEqual(list(browser_charsets.getPreferredCharsets()),
                          ['utf-8', 'iso-8859-1'])
 
+    def testParsedHeadersAreShared(self):
+        from zope.publisher.http import _parse_accept_charset
+        request = {'HTTP_ACCEPT_CHARSET': 'ISO-8859-1, UTF-16;q=0.33'}
+        first = HTTPCharsets(request).getPreferredCharsets()
+        misses = _parse_accept_charset.cache_info().misses
+        second = HTTPCharsets(request).getPreferredCharsets()
+        self.assertEqual(_parse_accept_charset.cache_info().misses, misses)
+        self.assertEqual(first, second)
+        # Callers get their own list.
+        first.append('spam')
+        self.assertEqual(second, ['iso-8859-1', 'utf-16'])
+
 
 def test_suite():
     loader = unittest.TestLoader()
@@ -0,0 +1,133 @@
+##############################################################################
+#
+# Copyright (c) Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Testing the JSON-RPC Publisher code.
+"""
+import datetime
+import doctest
+import json
+import sys
+import unittest
+
+import zope.component.testing
+
+from zope.publisher import jsonrpc
+
+
+def setUp(test):
+    zope.component.testing.setUp(test)
+    zope.component.provideAdapter(jsonrpc.ListPreMarshaller)
+    zope.component.provideAdapter(jsonrpc.TuplePreMarshaller)
+    zope.component.provideAdapter(jsonrpc.DatePreMarshaller)
+    zope.component.provideAdapter(jsonrpc.DictPreMarshaller)
+
+
+class TestJSONRPCResponse(unittest.TestCase):
+
+    def setUp(self):
+        setUp(self)
+
+    def tearDown(self):
+        zope.component.testing.tearDown(self)
+
+    def testConsumeBody(self):
+        response = jsonrpc.JSONRPCResponse()
+        response.setResult(['hi', datetime.date(2025, 3, 5)])
+
+        body = response.consumeBody()
+        self.assertIsInstance(body, bytes)
+        self.assertEqual(json.loads(body),
+                         {'jsonrpc': '2.0', 'result': ['hi', '2025-03-05'],
+                          'id': None})
+        self.assertEqual(response.getHeader('content-length'),
+                         str(len(body)))
+
+    def testPluggableCodec(self):
+        class Response(jsonrpc.JSONRPCResponse):
+            json_dumps = staticmethod(
+                lambda data: json.dumps(data, sort_keys=True).encode())
+
+        response = Response()
+        response.setResult({'b': 1, 'a': 2})
+        self.assertEqual(
+            response.consumeBody(),
+            b'{"id": null, "jsonrpc": "2.0", "result": {"a": 2, "b": 1}}')
+
+    def testJSONRPCError(self):
+        response = jsonrpc.JSONRPCResponse()
+        try:
+            raise jsonrpc.JSONRPCError(jsonrpc.INVALID_PARAMS,
+                                       'Invalid params', {'missing': ['a']})
+        except jsonrpc.JSONRPCError:
+            response.handleException(sys.exc_info())
+        self.assertEqual(response.getStatus(), 200)
+        self.assertEqual(json.loads(response.consumeBody())['error'],
+                         {'code': -32602, 'message': 'Invalid params',
+                          'data': {'missing': ['a']}})
+
+    def _streamingResponse(self):
+        response = jsonrpc.JSONRPCResponse()
+        response.stream_results = True
+        return response
+
+    def testStreamResults(self):
+        result = [{'name': 'item\xe9%d' % i, 'tags': ['a', 'b'], 1: None}
+                  for i in range(5000)]
+        response = self._streamingResponse()
+        response.setResult(result)
+        self.assertEqual(response.getHeader('content-type'),
+                         'application/json')
+        self.assertIsNone(response.getHeader('content-length'))
+        body = list(response.consumeBodyIter())
+        self.assertGreater(len(body), 1)
+        self.assertEqual(json.loads(b''.join(body)),
+                         json.loads(json.dumps({'jsonrpc': '2.0',
+                                                'result': result,
+                                                'id': None})))
+
+    def testStreamResultsError(self):
+        response = self._streamingResponse()
+        response.setResult([object()])
+        body = json.loads(response.consumeBody())
+        self.assertEqual(body['error']['code'], jsonrpc.INTERNAL_ERROR)
+        self.assertIn('TypeError', body['error']['message'])
+
+
+class TestPremarshal(unittest.TestCase):
+
+    def setUp(self):
+        setUp(self)
+
+    def tearDown(self):
+        zope.component.testing.tearDown(self)
+
+    def testNestedProxiesAreRemoved(self):
+        from zope.security.checker import ProxyFactory
+        from zope.security.proxy import Proxy
+        data = [ProxyFactory({'a': ProxyFactory([1, 2])}), (3, 'x')]
+        result = jsonrpc.premarshal(data)
+        self.assertEqual(result, [{'a': [1, 2]}, [3, 'x']])
+        self.assertNotIsInstance(result[0], Proxy)
+        self.assertNotIsInstance(result[0]['a'], Proxy)
+
+
+def test_suite():
+    return unittest.TestSuite((
+        unittest.defaultTestLoader.loadTestsFromName(__name__),
+        doctest.DocTestSuite(
+            'zope.publisher.jsonrpc',
+            setUp=setUp,
+            tearDown=zope.component.testing.tearDown,
+            optionflags=doctest.NORMALIZE_WHITESPACE,
+        ),
+    ))
@@ -0,0 +1,290 @@
+##############################################################################
+#
+# Copyright (c) Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""JSON-RPC Request Tests
+"""
+import json
+import unittest
+from io import BytesIO
+
+from zope.publisher.base import DefaultPublication
+from zope.publisher.http import HTTPCharsets
+from zope.publisher.interfaces import Retry
+from zope.publisher.jsonrpc import JSONRPCError
+from zope.publisher.jsonrpc import JSONRPCRequest
+from zope.publisher.publish import publish
+
+
+class Publication(DefaultPublication):
+
+    require_docstrings = 0
+
+    def getDefaultTraversal(self, request, ob):
+        if hasattr(ob, 'browserDefault'):
+            return ob.browserDefault(request)
+        return ob, ()
+
+
+class TestJSONRPCRequest(JSONRPCRequest, HTTPCharsets):
+    """Make sure that our request also implements IHTTPCharsets, so that we do
+    not need to register any adapters."""
+
+    def __init__(self, *args, **kw):
+        self.request = self
+        JSONRPCRequest.__init__(self, *args, **kw)
+
+
+jsonrpc_call = (
+    b'{"jsonrpc": "2.0", "method": "action", "params": [1], "id": 7}')
+
+
+class JSONRPCTests(unittest.TestCase):
+    """The only thing different to HTTP is the input processing; so there
+       is no need to redo all the HTTP tests again.
+    """
+
+    _testEnv = {
+        'PATH_INFO': '/folder/item2/view/',
+        'QUERY_STRING': '',
+        'SERVER_URL': 'http://foobar.com',
+        'HTTP_HOST': 'foobar.com',
+        'CONTENT_LENGTH': '0',
+        'CONTENT_TYPE': 'application/json',
+        'REQUEST_METHOD': 'POST',
+        'GATEWAY_INTERFACE': 'TestFooInterface/1.0',
+    }
+
+    def setUp(self):
+        super().setUp()
+
+        class AppRoot:
+            pass
+
+        class Folder:
+            pass
+
+        class View:
+
+            def action(self, a):
+                return "Parameter[type: {}; value: {}".format(
+                    type(a).__name__, repr(a))
+
+            def add(self, a, b=0):
+                return a + b
+
+            def conflict(self):
+                raise Retry()
+
+        class Item2:
+            view = View()
+
+        self.app = AppRoot()
+        self.app.folder = Folder()
+        self.app.folder.item2 = Item2()
+
+    def _createRequest(self, extra_env={}, body=b""):
+        env = self._testEnv.copy()
+        env.update(extra_env)
+        if len(body):
+            env['CONTENT_LENGTH'] = str(len(body))
+
+        publication = Publication(self.app)
+        instream = BytesIO(body)
+        request = TestJSONRPCRequest(instream, env)
+        request.setPublication(publication)
+        return request
+
+    def _publish(self, data):
+        req = self._createRequest({}, json.dumps(data).encode())
+        publish(req)
+        return req
+
+    def testProcessInput(self):
+        req = self._createRequest({}, jsonrpc_call)
+        req.processInputs()
+        self.assertEqual(req.getPositionalArguments(), (1,))
+        self.assertEqual(tuple(req._path_suffix), ('action',))
+        self.assertEqual(req._id, 7)
+        self.assertFalse(req._notification)
+
+    def testProcessInputInBlocks(self):
+        req = self._createRequest({}, jsonrpc_call)
+        req.read_block_size = 16
+        req.processInputs()
+        self.assertEqual(req.getPositionalArguments(), (1,))
+
+    def testNamedParameters(self):
+        req = self._createRequest({}, json.dumps({
+            'jsonrpc': '2.0', 'method': 'add', 'params': {'a': 1, 'b': 2},
+        }).encode())
+        req.processInputs()
+        self.assertEqual(req.getPositionalArguments(), ())
+        self.assertEqual(req.get('a'), 1)
+        self.assertEqual(req['b'], 2)
+        self.assertTrue(req._notification)
+
+    def testInvalidInput(self):
+        for body, code in [(b'{"jsonrpc": "2.0", "method"', -32700),
+                           (b'[]', -32600),
+                           (b'{"method": "action"}', -32600),
+                           (b'{"jsonrpc": "2.0", "method": 1}', -32600),
+                           (b'{"jsonrpc": "2.0", "method": "action",'
+                            b' "params": 1}', -32600)]:
+            req = self._createRequest({}, body)
+            with self.assertRaises(JSONRPCError) as e:
+                req.processInputs()
+            self.assertEqual(e.exception.code, code)
+
+    def testMaxBodySize(self):
+        from zope.publisher.interfaces import BadRequest
+        req = self._createRequest({}, jsonrpc_call)
+        req.max_body_size = 10
+        self.assertRaises(BadRequest, req.processInputs)
+
+    def testPublish(self):
+        req = self._publish({'jsonrpc': '2.0', 'method': 'add',
+                             'params': {'a': 1, 'b': 2}, 'id': 'x'})
+        self.assertEqual(req.response.getStatus(), 200)
+        self.assertEqual(req.response.getHeader('content-type'),
+                         'application/json')
+        self.assertEqual(json.loads(req.response.consumeBody()),
+                         {'jsonrpc': '2.0', 'result': 3, 'id': 'x'})
+
+    def testPublishError(self):
+        req = self._publish({'jsonrpc': '2.0', 'method': 'missing', 'id': 1})
+        self.assertEqual(req.response.getStatus(), 200)
+        self.assertEqual(json.loads(req.response.consumeBody()),
+                         {'jsonrpc': '2.0', 'id': 1,
+                          'error': {'code': -32601,
+                                    'message': 'Method not found'}})
+
+        req = self._createRequest({}, b'{')
+        publish(req)
+        self.assertEqual(json.loads(req.response.consumeBody()),
+                         {'jsonrpc': '2.0', 'id': None,
+                          'error': {'code': -32700,
+                                    'message': 'Parse error'}})
+
+    def testPublishNotification(self):
+        req = self._publish({'jsonrpc': '2.0', 'method': 'add',
+                             'params': [1]})
+        self.assertEqual(req.response.getStatus(), 204)
+        self.assertEqual(req.response.consumeBody(), b'')
+
+    _calls = [{'jsonrpc': '2.0', 'method': 'action', 'params': [1], 'id': 1},
+              {'jsonrpc': '2.0', 'method': 'missing', 'id': 2},
+              {'jsonrpc': '2.0', 'method': 'add', 'params': [1]},
+              {'method': 'action', 'id': 4},
+              1,
+              {'jsonrpc': '2.0', 'method': 'add', 'params': {'a': 2},
+               'id': 6}]
+
+    def _publishBatch(self, batch, publication=None):
+        req = self._createRequest({}, json.dumps(self._calls).encode())
+        req.batch = batch
+        if publication is not None:
+            req.setPublication(publication)
+        publish(req)
+        self.assertEqual(req.response.getStatus(), 200)
+        return req, json.loads(req.response.consumeBody())
+
+    def testBatch(self):
+        req, results = self._publishBatch('request')
+        self.assertEqual(results, [
+            {'jsonrpc': '2.0', 'result': 'Parameter[type: int; value: 1',
+             'id': 1},
+            {'jsonrpc': '2.0', 'id': 2,
+             'error': {'code': -32601, 'message': 'Method not found'}},
+            {'jsonrpc': '2.0', 'id': 4,
+             'error': {'code': -32600, 'message': 'Invalid Request'}},
+            {'jsonrpc': '2.0', 'id': None,
+             'error': {'code': -32600, 'message': 'Invalid Request'}},
+            {'jsonrpc': '2.0', 'result': 2, 'id': 6},
+        ])
+        self.assertEqual(req.getURL(), 'http://foobar.com/folder/item2/view')
+
+    def testBatchPerCall(self):
+        events = []
+
+        class EachCallPublication(Publication):
+            def afterCall(self, request, ob):
+                events.append('afterCall')
+
+            def handleException(self, ob, request, exc_info,
+                                retry_allowed=1):
+                events.append(('handleException', retry_allowed))
+                super().handleException(ob, request, exc_info, retry_allowed)
+
+        req, results = self._publishBatch(
+            'call', EachCallPublication(self.app))
+        self.assertEqual(len(results), 5)
+        # Invalid calls are answered without publishing them.
+        self.assertEqual(events, ['afterCall',
+                                  ('handleException', False),
+                                  'afterCall',
+                                  'afterCall',
+                                  # The publication of the request itself.
+                                  'afterCall'])
+
+    def testBatchURL(self):
+        urls = []
+
+        class URLPublication(Publication):
+            def callObject(self, request, ob):
+                urls.append(request.getURL())
+                return super().callObject(request, ob)
+
+        req = self._createRequest({}, json.dumps(
+            [{'jsonrpc': '2.0', 'method': 'add', 'params': [1], 'id': 1}]
+        ).encode())
+        req.setPublication(URLPublication(self.app))
+        publish(req)
+        # The URL of the batch itself, then that of the call.
+        self.assertEqual(urls, ['http://foobar.com/folder/item2/view',
+                                'http://foobar.com/folder/item2/view/add'])
+        self.assertEqual(req.getURL(), 'http://foobar.com/folder/item2/view')
+
+    def testBatchPerCallRetry(self):
+        # Calls committed already must not be made again, so a Retry
+        # only fails its call.
+        calls = []
+
+        class CountingPublication(Publication):
+            def callObject(self, request, ob):
+                calls.append(getattr(ob, '__name__', None))
+                return super().callObject(request, ob)
+
+        req = self._createRequest({}, json.dumps(
+            [{'jsonrpc': '2.0', 'method': 'add', 'params': [1], 'id': 1},
+             {'jsonrpc': '2.0', 'method': 'conflict', 'id': 2},
+             {'jsonrpc': '2.0', 'method': 'add', 'params': [2], 'id': 3}]
+        ).encode())
+        req.batch = 'call'
+        req.setPublication(CountingPublication(self.app))
+        publish(req)
+        results = json.loads(req.response.consumeBody())
+        self.assertEqual(calls, [None, 'add', 'conflict', 'add'])
+        self.assertEqual(results[0]['result'], 1)
+        self.assertIn('Retry', results[1]['error']['message'])
+        self.assertEqual(results[2]['result'], 2)
+
+    def testBatchOfNotifications(self):
+        req = self._publish([{'jsonrpc': '2.0', 'method': 'add',
+                              'params': [1]}])
+        self.assertEqual(req.response.getStatus(), 204)
+        self.assertEqual(req.response.consumeBody(), b'')
+
+
+def test_suite():
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(JSONRPCTests)
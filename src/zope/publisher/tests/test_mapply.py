@@ -46,6 +46,28 @@ class MapplyTests(unittest.TestCase):
         v = mapply(cc.compute, (), values)
         self.assertEqual(v, '334')
 
+    def testClassConstructor(self):
+        class c:
+            pass
+        self.assertRaises(TypeError, mapply, c, (), {})
+
+    def testMissingArgument(self):
+        def compute(a, b):
+            raise AssertionError('not reached')
+        self.assertRaises(TypeError, mapply, compute, (), {'a': 1})
+
+    def testFunctionsAndMethods(self):
+        class C:
+            def method(self, a, b=2):
+                return a + b
+
+        def function(a, b=2):
+            return a + b
+
+        self.assertEqual(mapply(function, (), {'a': 1}), 3)
+        self.assertEqual(mapply(C().method, (), {'a': 1, 'b': 3}), 4)
+        self.assertRaises(TypeError, mapply, C().method, (1, 2, 3), {})
+
 
 def test_suite():
     loader = unittest.TestLoader()
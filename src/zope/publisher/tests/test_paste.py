@@ -12,6 +12,7 @@
 #
 ##############################################################################
 import doctest
+import io
 import unittest
 
 
@@ -56,8 +57,74 @@ class SamplePublication:
         return self, ()
 
 
+class FilePublication(SamplePublication):
+
+    def __init__(self, body):
+        self.body = body
+        self.args = {}, {}
+
+    def callObject(self, request, ob):
+        from zope.publisher.http import FileResult
+        return FileResult(io.BytesIO(self.body), offset=self.offset)
+
+
+class FileWrapperTests(unittest.TestCase):
+
+    def _call(self, offset, file_wrapper=None):
+        from zope.publisher.paste import Application
+        app = Application({}, publication='egg:zope.publisher#sample')
+        app.publication = FilePublication(b'0123456789')
+        app.publication.offset = offset
+        env = {'PATH_INFO': '/a', 'REQUEST_METHOD': 'GET',
+               'wsgi.input': io.BytesIO(b'')}
+        if file_wrapper is not None:
+            env['wsgi.file_wrapper'] = file_wrapper
+        return app(env, lambda status, headers: None)
+
+    def test_file_wrapper(self):
+        wrapped = []
+
+        def file_wrapper(file, block_size):
+            wrapped.append((file.tell(), block_size))
+            return iter(lambda: file.read(block_size), b'')
+
+        self.assertEqual(b''.join(self._call(4, file_wrapper)), b'456789')
+        self.assertEqual(wrapped, [(4, 65536)])
+
+    def test_without_file_wrapper(self):
+        self.assertEqual(b''.join(self._call(4)), b'456789')
+
+
+class RequestClassTests(unittest.TestCase):
+
+    def _request(self, content_type, method='POST', **options):
+        from zope.publisher.paste import Application
+        app = Application({}, publication='egg:zope.publisher#sample',
+                          **options)
+        return app.request({'REQUEST_METHOD': method,
+                            'CONTENT_TYPE': content_type,
+                            'wsgi.input': io.BytesIO(b'')})
+
+    def test_jsonrpc(self):
+        from zope.publisher.browser import BrowserRequest
+        from zope.publisher.jsonrpc import JSONRPCRequest
+        self.assertIsInstance(
+            self._request('application/json; charset=utf-8', jsonrpc='true'),
+            JSONRPCRequest)
+        self.assertIs(
+            type(self._request('application/json', 'GET', jsonrpc='true')),
+            BrowserRequest)
+        self.assertIs(
+            type(self._request('text/plain', jsonrpc='true')),
+            BrowserRequest)
+        self.assertIs(type(self._request('application/json')),
+                      BrowserRequest)
+
+
 def test_suite():
     return unittest.TestSuite((
+        unittest.defaultTestLoader.loadTestsFromTestCase(FileWrapperTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(RequestClassTests),
         doctest.DocFileSuite(
             '../paste.txt',
             optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE,
@@ -13,7 +13,11 @@
 ##############################################################################
 """Test Publisher
 """
+import asyncio
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
 from zope.interface import implementedBy
@@ -28,8 +32,12 @@ from zope.publisher.interfaces import IReRaiseException
 from zope.publisher.interfaces import NotFound
 from zope.publisher.interfaces import Retry
 from zope.publisher.interfaces import Unauthorized
+from zope.publisher.publish import PUBLICATION_TIMER_KEY
 from zope.publisher.publish import DoNotReRaiseException
+from zope.publisher.publish import PublicationTimer
+from zope.publisher.publish import getPublicationTimer
 from zope.publisher.publish import publish
+from zope.publisher.publish import publish_async
 
 
 class ErrorToRetry(Exception):
@@ -173,7 +181,219 @@ class PublisherTests(unittest.TestCase):
         # an original exception.
         self.assertRaises(Retry, publish, request, handle_errors=False)
 
+    def testNoTimerByDefault(self):
+        request = self._createRequest('/folder/item')
+        publish(request)
+        self.assertIsNone(getPublicationTimer(request))
+
+    def testPhaseTimings(self):
+        request = self._createRequest('/folder/item')
+        timer = request.annotations[PUBLICATION_TIMER_KEY] = \
+            PublicationTimer()
+        publish(request)
+        record = timer.getRecord()
+        for phase in ('processInputs', 'beforeTraversal', 'getApplication',
+                      'traverse', 'afterTraversal', 'callObject',
+                      'setResult', 'afterCall', 'endRequest'):
+            self.assertGreaterEqual(record[phase + '_ns'], 0)
+        self.assertNotIn('handleException_ns', record)
+        self.assertEqual(record['retries'], 0)
+        self.assertGreaterEqual(record['total_ns'],
+                                sum(timer.durations.values()))
+
+    def testFailingPhaseIsTimed(self):
+        class SlowNotFoundPublication(DefaultPublication):
+            def getApplication(self, request):
+                time.sleep(0.01)
+                raise NotFound(None, 'app')
+
+            def handleException(self, object, request, exc_info,
+                                retry_allowed=True):
+                pass
+
+        request = self._createRequest('/folder/item')
+        request.setPublication(SlowNotFoundPublication(self.app))
+        timer = request.annotations[PUBLICATION_TIMER_KEY] = \
+            PublicationTimer()
+        publish(request)
+        record = timer.getRecord()
+        self.assertGreaterEqual(record['getApplication_ns'], 10000000)
+        self.assertLess(record['handleException_ns'], 10000000)
+        self.assertNotIn('traverse_ns', record)
+
+    def testPhaseTimingsFollowRetries(self):
+        class RetryPublication(DefaultPublication):
+            def handleException(self, object, request, exc_info,
+                                retry_allowed=True):
+                raise Retry(exc_info)
+
+        class RetryRequest(TestRequest):
+            __slots__ = ('retried',)
+
+            def supportsRetry(self):
+                return not getattr(self, 'retried', False)
+
+            def retry(self):
+                request = RetryRequest(BytesIO(b''))
+                request.retried = True
+                request.setTraversalStack(['retryItem'])
+                request.setPublication(self.publication)
+                return request
+
+        request = RetryRequest(BytesIO(b''))
+        request.setTraversalStack(['retryItem'])
+        request.setPublication(RetryPublication(self.app))
+        timer = request.annotations[PUBLICATION_TIMER_KEY] = \
+            PublicationTimer()
+        self.assertRaises(ErrorToRetry, publish, request, handle_errors=False)
+        self.assertEqual(timer.retries, 1)
+        self.assertIn('retry_ns', timer.getRecord())
+
+
+class AsyncPublisherTests(unittest.TestCase):
+    """Test what publish_async() does beyond publish()."""
+
+    setUp = PublisherTests.setUp
+    _createRequest = PublisherTests._createRequest
+
+    def _publisherResults(self, path, **kw):
+        request = self._createRequest(path, **kw)
+        response = request.response
+        asyncio.run(publish_async(request, handle_errors=False))
+        return response._result
+
+    def testTraversalToItem(self):
+        self.assertEqual(self._publisherResults('/folder/item'), 'item')
+        self.assertRaises(NotFound, self._publisherResults, '/foo')
+
+    def testAwaitsCoroutineResults(self):
+        class AsyncItem:
+            """Required docstring for the publisher."""
+
+            async def __call__(self):
+                await asyncio.sleep(0)
+                return 'async item'
+
+        self.app.folder.asyncItem = AsyncItem()
+        self.assertEqual(
+            self._publisherResults('/folder/asyncItem'), 'async item')
+
+    def testDoesNotAwaitHookResults(self):
+        async def coroutine():
+            return 'awaited'
+
+        class AwaitableItem:
+            """Required docstring for the publisher."""
+
+            def __await__(self):
+                return coroutine().__await__()
+
+            def __call__(self):
+                return 'item'
+
+        self.app.folder.awaitableItem = AwaitableItem()
+        self.assertEqual(
+            self._publisherResults('/folder/awaitableItem'), 'item')
+
+    def testAwaitsCoroutineHooks(self):
+        calls = []
+
+        class AsyncPublication(DefaultPublication):
+            async def beforeTraversal(self, request):
+                calls.append('beforeTraversal')
+                super().beforeTraversal(request)
+
+            async def endRequest(self, request, ob):
+                calls.append('endRequest')
+
+        request = self._createRequest('/folder/item')
+        request.setPublication(AsyncPublication(self.app))
+        asyncio.run(publish_async(request))
+        self.assertEqual(request.response._result, 'item')
+        self.assertEqual(calls, ['beforeTraversal', 'endRequest'])
+
+    def _publishRecordingThreads(self, executor=None):
+        threads = []
+
+        class RecordingPublication(DefaultPublication):
+            def beforeTraversal(self, request):
+                threads.append(threading.get_ident())
+                super().beforeTraversal(request)
+
+            def callObject(self, request, ob):
+                threads.append(threading.get_ident())
+                return super().callObject(request, ob)
+
+            def endRequest(self, request, ob):
+                threads.append(threading.get_ident())
+                super().endRequest(request, ob)
+
+        request = self._createRequest('/folder/item')
+        request.setPublication(RecordingPublication(self.app))
+        asyncio.run(publish_async(request, executor=executor))
+        self.assertEqual(request.response._result, 'item')
+        return threads
+
+    def testSynchronousHooksRunInOneThread(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            threads = self._publishRecordingThreads(executor)
+        self.assertEqual(len(threads), 3)
+        self.assertEqual(len(set(threads)), 1)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    def testSynchronousHooksDoNotBlockTheLoop(self):
+        threads = self._publishRecordingThreads()
+        self.assertEqual(len(set(threads)), 1)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    def testRetryErrorIsUnwrapped(self):
+        class RetryPublication(DefaultPublication):
+            def handleException(self, object, request, exc_info,
+                                retry_allowed=True):
+                raise Retry(exc_info)
+
+        request = self._createRequest('/retryItem')
+        request.setPublication(RetryPublication(self.app))
+        self.assertRaises(
+            ErrorToRetry, asyncio.run,
+            publish_async(request, handle_errors=False))
+
+    @unittest.skipUnless(hasattr(asyncio, 'timeout'), 'Python 3.11+')
+    def testCancellation(self):
+        calls = []
+
+        class SlowItem:
+            """Required docstring for the publisher."""
+
+            async def __call__(self):
+                await asyncio.sleep(10)
+
+        class RecordingPublication(DefaultPublication):
+            def handleException(self, object, request, exc_info,
+                                retry_allowed=True):
+                calls.append('handleException')
+
+            def endRequest(self, request, ob):
+                calls.append('endRequest')
+
+        async def publishWithTimeout(request):
+            async with asyncio.timeout(0.01):
+                await publish_async(request)
+
+        self.app.folder.slowItem = SlowItem()
+        request = self._createRequest('/folder/slowItem')
+        request.setPublication(RecordingPublication(self.app))
+        self.assertRaises(TimeoutError, asyncio.run,
+                          publishWithTimeout(request))
+        # The request is ended and closed, but the cancellation isn't
+        # handled like an error of the application.
+        self.assertEqual(calls, ['endRequest'])
+        self.assertIsNone(request._held)
+
 
 def test_suite():
     loader = unittest.TestLoader()
-    return loader.loadTestsFromTestCase(PublisherTests)
+    return unittest.TestSuite((
+        loader.loadTestsFromTestCase(PublisherTests),
+        loader.loadTestsFromTestCase(AsyncPublisherTests),
+    ))
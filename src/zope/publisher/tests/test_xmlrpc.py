@@ -35,6 +35,82 @@ class TestXMLRPCResponse(unittest.TestCase):
         self.assertIsInstance(body, bytes)
         self.assertIn(b'<methodResponse>', body)
 
+    def _streamingResponse(self):
+        response = xmlrpc.XMLRPCResponse()
+        response.stream_results = True
+        return response
+
+    def testStreamResults(self):
+        result = [{'name': 'item%d' % i, 'tags': ['a', 'b']}
+                  for i in range(5000)]
+        expected = xmlrpclib.dumps(
+            (result,), methodresponse=True).encode('utf-8')
+        response = self._streamingResponse()
+        response.setResult(result)
+        self.assertEqual(response.getHeader('content-type'),
+                         'text/xml;charset=utf-8')
+        self.assertIsNone(response.getHeader('content-length'))
+        body = list(response.consumeBodyIter())
+        self.assertGreater(len(body), 1)
+        self.assertEqual(b''.join(body), expected)
+
+    def testStreamResultsFault(self):
+        response = self._streamingResponse()
+        response.setResult([object()])
+        body = response.consumeBody()
+        self.assertIn(b'<fault>', body)
+        self.assertIn(b'cannot marshal', body)
+        self.assertEqual(response.getHeader('content-length'),
+                         str(len(body)))
+
+
+class TestPremarshal(unittest.TestCase):
+
+    def setUp(self):
+        doctest_setUp(self)
+
+    def tearDown(self):
+        zope.component.testing.tearDown(self)
+
+    def testContainersAreCopied(self):
+        data = {'a': [1, (2.5, 'x'), {'b': None}], 'c': (True, b'y')}
+        result = xmlrpc.premarshal(data)
+        self.assertEqual(
+            result, {'a': [1, [2.5, 'x'], {'b': None}], 'c': [True, b'y']})
+        self.assertIsNot(result, data)
+        self.assertIsNot(result['a'][2], data['a'][2])
+
+    def testNestedProxiesAreRemoved(self):
+        from zope.security.checker import ProxyFactory
+        from zope.security.proxy import Proxy
+        data = [ProxyFactory({'a': ProxyFactory([1, 2])}),
+                ProxyFactory(xmlrpclib.Binary(b'spam'))]
+        result = xmlrpc.premarshal(data)
+        self.assertEqual(result[0], {'a': [1, 2]})
+        self.assertNotIsInstance(result[0], Proxy)
+        self.assertNotIsInstance(result[0]['a'], Proxy)
+        self.assertIs(type(result[1]), xmlrpclib.Binary)
+
+    def testRegisteredPremarshallersForBuiltinTypes(self):
+        @zope.component.adapter(int)
+        class IntPreMarshaller(xmlrpc.PreMarshallerBase):
+            def __call__(self):
+                return str(self.data)
+
+        self.assertEqual(xmlrpc.premarshal([1, 'a']), [1, 'a'])
+        zope.component.provideAdapter(IntPreMarshaller)
+        self.assertEqual(xmlrpc.premarshal([1, 'a']), ['1', 'a'])
+
+    def testWithoutPremarshallers(self):
+        zope.component.testing.tearDown(self)
+        data = [1, {'a': 2}]
+        self.assertIs(xmlrpc.premarshal(data), data)
+
+    def testRecursiveData(self):
+        data = []
+        data.append(data)
+        self.assertRaises(RecursionError, xmlrpc.premarshal, data)
+
 
 def doctest_setUp(test):
     zope.component.testing.setUp(test)
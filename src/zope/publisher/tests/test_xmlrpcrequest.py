@@ -14,10 +14,13 @@
 """XML-RPC Request Tests
 """
 import unittest
+import xmlrpc.client as xmlrpclib
 from io import BytesIO
 
 from zope.publisher.base import DefaultPublication
 from zope.publisher.http import HTTPCharsets
+from zope.publisher.interfaces import Retry
+from zope.publisher.publish import publish
 from zope.publisher.xmlrpc import XMLRPCRequest
 
 
@@ -93,6 +96,9 @@ class XMLRPCTests(unittest.TestCase):
                 return "Parameter[type: {}; value: {}".format(
                     type(a).__name__, repr(a))
 
+            def conflict(self):
+                raise Retry()
+
         class Item2:
             view = View()
 
@@ -126,6 +132,147 @@ class XMLRPCTests(unittest.TestCase):
         self.assertEqual(action(*req.getPositionalArguments()),
                          "Parameter[type: int; value: 1")
 
+    def testProcessInputInBlocks(self):
+        req = self._createRequest({}, xmlrpc_call)
+        req.read_block_size = 16
+        req.processInputs()
+        self.assertEqual(req.getPositionalArguments(), (1,))
+
+    def testBodyReadUpToContentLength(self):
+        req = self._createRequest({}, xmlrpc_call + b'trailing garbage')
+        req._body_instream.size = len(xmlrpc_call)
+        req.processInputs()
+        self.assertEqual(req.getPositionalArguments(), (1,))
+        self.assertEqual(req._body_instream.stream.read(), b'trailing garbage')
+
+    def testMaxBodySize(self):
+        from zope.publisher.interfaces import BadRequest
+        req = self._createRequest({}, xmlrpc_call)
+        req.max_body_size = len(xmlrpc_call)
+        req.processInputs()
+        self.assertEqual(req.getPositionalArguments(), (1,))
+
+        req = self._createRequest({}, xmlrpc_call)
+        req.max_body_size = 100
+        self.assertRaises(BadRequest, req.processInputs)
+
+        # The limit also applies when the length of the body is unknown.
+        req = self._createRequest({'CONTENT_LENGTH': ''}, xmlrpc_call)
+        req._body_instream.size = -1
+        req.max_body_size = 100
+        self.assertRaises(BadRequest, req.processInputs)
+
+    _calls = [{'methodName': 'action', 'params': [1]},
+              {'methodName': 'missing', 'params': []},
+              {'methodName': 'system.multicall', 'params': [[]]},
+              {'params': []},
+              {'methodName': 'action', 'params': ['x']}]
+
+    def _publishMulticall(self, multicall, publication=None, calls=None):
+        if calls is None:
+            calls = self._calls
+        body = xmlrpclib.dumps((calls,), 'system.multicall').encode()
+        req = self._createRequest({}, body)
+        req.multicall = multicall
+        if publication is not None:
+            req.setPublication(publication)
+        publish(req)
+        self.assertEqual(req.response.getStatus(), 200)
+        (results,), method = xmlrpclib.loads(req.response.consumeBody())
+        return req, results
+
+    def testMulticall(self):
+        req, results = self._publishMulticall('request')
+        self.assertEqual(results[0], ['Parameter[type: int; value: 1'])
+        self.assertEqual(results[1]['faultCode'], -1)
+        self.assertIn('NotFound', results[1]['faultString'])
+        self.assertEqual(results[2]['faultCode'], -32600)
+        self.assertEqual(results[2]['faultString'],
+                         'Recursive system.multicall forbidden')
+        self.assertEqual(results[3]['faultCode'], -32600)
+        self.assertEqual(results[4], ["Parameter[type: str; value: 'x'"])
+        self.assertEqual(req.getURL(), 'http://foobar.com/folder/item2/view')
+
+    def testMulticallPerCall(self):
+        events = []
+
+        class EachCallPublication(Publication):
+            def afterCall(self, request, ob):
+                events.append('afterCall')
+
+            def handleException(self, ob, request, exc_info,
+                                retry_allowed=1):
+                events.append(('handleException', retry_allowed))
+                super().handleException(ob, request, exc_info, retry_allowed)
+
+        req, results = self._publishMulticall(
+            'call', EachCallPublication(self.app))
+        self.assertEqual(len(results), 5)
+        self.assertEqual(results[4], ["Parameter[type: str; value: 'x'"])
+        self.assertEqual(events, ['afterCall',
+                                  ('handleException', False),
+                                  ('handleException', False),
+                                  ('handleException', False),
+                                  'afterCall',
+                                  # The publication of the request itself.
+                                  'afterCall'])
+
+    def testMulticallURL(self):
+        urls = []
+
+        class URLPublication(Publication):
+            def callObject(self, request, ob):
+                urls.append(request.getURL())
+                return super().callObject(request, ob)
+
+        req, results = self._publishMulticall(
+            'request', URLPublication(self.app),
+            [{'methodName': 'action', 'params': [1]},
+             {'methodName': 'action', 'params': [2]}])
+        # The URL of the multicall itself, then those of the calls.
+        self.assertEqual(urls, ['http://foobar.com/folder/item2/view',
+                                'http://foobar.com/folder/item2/view/action',
+                                'http://foobar.com/folder/item2/view/action'])
+        self.assertEqual(req.getURL(), 'http://foobar.com/folder/item2/view')
+
+    def testMulticallPerCallRetry(self):
+        # Calls committed already must not be made again, so a Retry
+        # only fails its call.
+        calls = []
+
+        class CountingPublication(Publication):
+            def callObject(self, request, ob):
+                calls.append(getattr(ob, '__name__', None))
+                return super().callObject(request, ob)
+
+        req, results = self._publishMulticall(
+            'call', CountingPublication(self.app),
+            [{'methodName': 'action', 'params': [1]},
+             {'methodName': 'conflict', 'params': []},
+             {'methodName': 'action', 'params': [2]}])
+        self.assertEqual(calls, [None, 'action', 'conflict', 'action'])
+        self.assertEqual(results[0], ['Parameter[type: int; value: 1'])
+        self.assertIn('Retry', results[1]['faultString'])
+        self.assertEqual(results[2], ['Parameter[type: int; value: 2'])
+
+    def testMulticallRetry(self):
+        # In one publication, all calls are retried together.
+        body = xmlrpclib.dumps(
+            ([{'methodName': 'conflict', 'params': []}],),
+            'system.multicall').encode()
+        req = self._createRequest({}, body)
+        req.multicall = 'request'
+        req.processInputs()
+        ob = req.traverse(self.app)
+        self.assertRaises(Retry, ob)
+
+    def testMulticallDisabled(self):
+        body = xmlrpclib.dumps((self._calls,), 'system.multicall').encode()
+        req = self._createRequest({}, body)
+        req.processInputs()
+        self.assertEqual(req._path_suffix, ['multicall', 'system'])
+        self.assertIsNone(req._calls)
+
 
 def test_suite():
     loader = unittest.TestLoader()
@@ -22,12 +22,17 @@ from io import BytesIO
 
 import zope.component
 import zope.interface
+from zope.interface import implementedBy
 from zope.interface import implementer
 from zope.security.proxy import isinstance
 
+from zope.publisher.adaptercache import AdapterLookupCache
+from zope.publisher.base import BaseRequest
 from zope.publisher.http import DirectResult
 from zope.publisher.http import HTTPRequest
 from zope.publisher.http import HTTPResponse
+from zope.publisher.http import StreamingResult
+from zope.publisher.interfaces import Retry
 from zope.publisher.interfaces.xmlrpc import IXMLRPCPremarshaller
 from zope.publisher.interfaces.xmlrpc import IXMLRPCRequest
 from zope.publisher.interfaces.xmlrpc import IXMLRPCView
@@ -37,6 +42,23 @@ from zope.publisher.interfaces.xmlrpc import IXMLRPCView
 class XMLRPCRequest(HTTPRequest):
 
     _args = ()
+    _calls = None
+
+    # How ``system.multicall`` requests are published.  With None, the
+    # method name is traversed like any other.  With 'request', all calls
+    # are made in the publication of the request, e.g. in one transaction.
+    # With 'call', the publication ends after each call (`afterCall` or
+    # `handleException`), e.g. committing or aborting a transaction per
+    # call.  With 'request', the side effects of a failing call are
+    # committed with those of the other calls.  Use 'call' if they must
+    # be aborted.
+    multicall = None
+
+    # The largest request body accepted, in bytes, or None for no limit.
+    max_body_size = None
+
+    # The size of the blocks the request body is read and parsed in.
+    read_block_size = 1 << 16
 
     def _createResponse(self):
         """Create a specific XML-RPC response object."""
@@ -44,18 +66,23 @@ class XMLRPCRequest(HTTPRequest):
 
     def processInputs(self):
         """See IPublisherRequest."""
-        # Parse the request XML structure
-
-        # Using lines() does not work as Twisted's BufferedStream sends back
-        # an empty stream here for read() (bug). Using readlines() does not
-        # work with paster.httpserver. However, readline() works fine.
-        lines = b''
-        while True:
-            line = self._body_instream.readline()
-            if not line:
-                break
-            lines += line
-        self._args, function = xmlrpclib.loads(lines)
+        # Parse the request XML structure block by block as it is read,
+        # instead of reading the whole body before parsing it.
+        parser, unmarshaller = xmlrpclib.getparser()
+        for data in self._readBody():
+            parser.feed(data)
+        parser.close()
+        self._args = unmarshaller.close()
+        function = unmarshaller.getmethodname()
+
+        if function == 'system.multicall' and self.multicall:
+            if len(self._args) != 1 or not isinstance(
+                    self._args[0], (list, tuple)):
+                raise xmlrpclib.Fault(
+                    -32602, 'system.multicall expects an array of calls')
+            self._calls = self._args[0]
+            self._args = ()
+            return
 
         # Translate '.' to '/' in function to represent object traversal.
         function = function.split('.')
@@ -63,6 +90,17 @@ class XMLRPCRequest(HTTPRequest):
         if function:
             self.setPathSuffix(function)
 
+    def traverse(self, obj):
+        """See IPublisherRequest."""
+        ob = super().traverse(obj)
+        if self._calls is not None:
+            ob = MultiCall(ob, self)
+        return ob
+
+    def _readBody(self):
+        return self._body_instream.readBlocks(
+            self.read_block_size, self.max_body_size)
+
 
 class TestRequest(XMLRPCRequest):
 
@@ -91,6 +129,11 @@ class XMLRPCResponse(HTTPResponse):
     This object is responsible for converting all output to valid XML-RPC.
     """
 
+    # Set this to True to marshal results while they are sent instead of
+    # building the complete XML-RPC response first.  Only errors while
+    # marshalling the first block can then be reported as faults.
+    stream_results = False
+
     def setResult(self, result):
         """Set the result of the response
 
@@ -104,6 +147,15 @@ class XMLRPCResponse(HTTPResponse):
         message instead of a generic HTML page.
         """
         body = premarshal(result)
+        if self.stream_results and not isinstance(body, xmlrpclib.Fault):
+            self.setHeader('content-type', 'text/xml;charset=utf-8')
+            try:
+                super().setResult(StreamingResult(_marshalResponse(body)))
+            except:  # noqa: E722 do not use bare 'except'
+                # We really want to catch all exceptions at this point!
+                self.handleException(sys.exc_info())
+            return
+
         if isinstance(body, xmlrpclib.Fault):
             # Convert Fault object to XML-RPC response.
             body = xmlrpclib.dumps(body, methodresponse=True)
@@ -149,30 +201,177 @@ class XMLRPCResponse(HTTPResponse):
         >>> 'Unexpected Zope exception: AttributeError: xyz' in body
         True
         """
-        t, value = exc_info[:2]
-        s = '{}: {}'.format(getattr(t, '__name__', t), value)
-
-        # Create an appropriate Fault object. Unfortunately, we throw away
-        # most of the debugging information. More useful error reporting is
-        # left as an exercise for the reader.
-        Fault = xmlrpclib.Fault
-        fault_text = None
-        try:
-            if isinstance(value, Fault):
-                fault_text = value
-            elif isinstance(value, Exception):
-                fault_text = Fault(-1, "Unexpected Zope exception: " + s)
-            else:
-                fault_text = Fault(-2, "Unexpected Zope error value: " + s)
-        except:  # noqa: E722 do not use bare 'except'
-            fault_text = Fault(-3, "Unknown Zope fault type")
-
         # Do the damage.
-        self.setResult(fault_text)
+        self.setResult(_fault(exc_info))
         # XML-RPC prefers a status of 200 ("ok") even when reporting errors.
         self.setStatus(200)
 
 
+_PARAM_START = len('<params>\n<param>\n')
+_PARAM_END = -len('</param>\n</params>\n')
+
+
+def _marshalResponse(value, block_size=1 << 16):
+    # Marshal `value` as an XML-RPC response like xmlrpc.client.dumps, but
+    # yield the XML in blocks of about `block_size` characters.  Blocks end
+    # after items of the top-level array or struct.
+    marshaller = xmlrpclib.Marshaller('utf-8', allow_none=True)
+    out = []
+    size = 0
+
+    def write(text):
+        nonlocal size
+        out.append(text)
+        size += len(text)
+
+    def flush():
+        nonlocal size
+        block = ''.join(out)
+        out.clear()
+        size = 0
+        return block
+
+    def dump(value):
+        # Marshaller.dumps wraps the value in a parameter block.
+        write(marshaller.dumps((value,))[_PARAM_START:_PARAM_END])
+
+    write("<?xml version='1.0'?>\n<methodResponse>\n<params>\n<param>\n")
+    if type(value) in (list, tuple):
+        write("<value><array><data>\n")
+        for item in value:
+            dump(item)
+            if size >= block_size:
+                yield flush()
+        write("</data></array></value>\n")
+    elif type(value) is dict:
+        write("<value><struct>\n")
+        for key, item in value.items():
+            if not isinstance(key, str):
+                raise TypeError("dictionary key must be string")
+            write("<member>\n<name>%s</name>\n" % xmlrpclib.escape(key))
+            dump(item)
+            write("</member>\n")
+            if size >= block_size:
+                yield flush()
+        write("</struct></value>\n")
+    else:
+        dump(value)
+    write("</param>\n</params>\n</methodResponse>\n")
+    yield flush()
+
+
+def _fault(exc_info):
+    """Return the Fault reporting the exception `exc_info`."""
+    t, value = exc_info[:2]
+    s = '{}: {}'.format(getattr(t, '__name__', t), value)
+
+    # Create an appropriate Fault object. Unfortunately, we throw away
+    # most of the debugging information. More useful error reporting is
+    # left as an exercise for the reader.
+    Fault = xmlrpclib.Fault
+    try:
+        if isinstance(value, Fault):
+            return value
+        elif isinstance(value, Exception):
+            return Fault(-1, "Unexpected Zope exception: " + s)
+        else:
+            return Fault(-2, "Unexpected Zope error value: " + s)
+    except:  # noqa: E722 do not use bare 'except'
+        return Fault(-3, "Unknown Zope fault type")
+
+
+class MultiCallBase:
+    """Base class for making the calls of a batch request.
+
+    The calls are made on (objects traversed from) `context`.  This is
+    shared by the XML-RPC ``system.multicall`` and JSON-RPC batches.
+    """
+
+    def __init__(self, context, request):
+        self.context = context
+        self.request = request
+
+    def _publishCall(self, each, error, traverse, *args):
+        # Make a call on the object returned by traverse(*args).  Return
+        # whether the call failed and its result, or what `error` makes
+        # of the exception.  With `each`, the publication ends after the
+        # call.
+        request = self.request
+        publication = request.publication
+        traversed = len(request._traversed_names)
+        ob = None
+        try:
+            ob = traverse(*args)
+            result = publication.callObject(request, ob)
+            if each:
+                publication.afterCall(request, ob)
+            return False, result
+        except:  # noqa: E722 do not use bare 'except'
+            exc_info = sys.exc_info()
+            try:
+                if each:
+                    # The calls before were committed already, so a
+                    # Retry fails only this call.
+                    publication.handleException(
+                        ob, request, exc_info, False)
+                elif isinstance(exc_info[1], Retry):
+                    # Retry all calls together.
+                    raise
+                return True, error(exc_info)
+            finally:
+                exc_info = None  # Avoid circular reference.
+        finally:
+            # The calls don't add to the URL of the request.
+            del request._traversed_names[traversed:]
+            request._invalidateURLs()
+
+    def _traverse(self, name):
+        # Traverse to the object publishing the method `name`.
+        request = self.request
+        steps = name.split('.')
+        steps.reverse()
+        request.setTraversalStack(steps)
+        return BaseRequest.traverse(request, self.context)
+
+
+def _faultStruct(exc_info):
+    fault = premarshal(_fault(exc_info))
+    return {'faultCode': fault.faultCode, 'faultString': fault.faultString}
+
+
+class MultiCall(MultiCallBase):
+    """The calls of a ``system.multicall`` request.
+
+    Calling it makes the calls and returns their results, each in a list
+    of its own, or their faults as structs.
+    """
+
+    def __call__(self):
+        request = self.request
+        each = request.multicall == 'call'
+        results = []
+        for call in request._calls:
+            failed, value = self._publishCall(
+                each, _faultStruct, self._traverseCall, call)
+            results.append(value if failed else [value])
+        request._args = ()
+        return results
+
+    def _traverseCall(self, call):
+        # Traverse to the method of `call` and set up its arguments.
+        try:
+            name = call['methodName']
+            params = tuple(call.get('params', ()))
+        except (TypeError, KeyError, AttributeError):
+            raise xmlrpclib.Fault(-32600, 'Invalid system.multicall call')
+        if name == 'system.multicall':
+            raise xmlrpclib.Fault(
+                -32600, 'Recursive system.multicall forbidden')
+        ob = self._traverse(name)
+        self.request._args = params
+        return ob
+
+
 @implementer(IXMLRPCView)
 class XMLRPCView:
     """A base XML-RPC view that can be used as mix-in for XML-RPC views."""
@@ -250,6 +449,82 @@ class PythonDateTimePreMarshaller(PreMarshallerBase):
         return xmlrpclib.DateTime(self.data.isoformat())
 
 
+# Instances of these types can't provide interfaces directly, so their
+# premarshallers only depend on the type and are looked up once per type.
+_builtin_types = frozenset(
+    (bool, int, float, complex, str, bytes, type(None), dict, list, tuple))
+
+
+class Premarshal:
+    """Premarshal data with the premarshallers providing `interface`.
+
+    Unproxied dicts and sequences with one of the `dict_premarshallers` or
+    `sequence_premarshallers` registered are copied into dicts and lists
+    without recursion and without looking up the premarshallers of
+    builtin types again and again.
+    """
+
+    def __init__(self, interface, dict_premarshallers,
+                 sequence_premarshallers):
+        self.interface = interface
+        self.dict_premarshallers = frozenset(dict_premarshallers)
+        self.sequence_premarshallers = frozenset(sequence_premarshallers)
+        self._premarshallers = AdapterLookupCache(interface)
+
+    def __call__(self, data):
+        factories = {}
+        result, todo = self._shallow(data, factories)
+        stack = [(todo, 1)] if todo is not None else []
+        limit = sys.getrecursionlimit()
+        while stack:
+            (items, target), depth = stack.pop()
+            if depth > limit:
+                raise RecursionError('maximum premarshal depth exceeded')
+            if type(target) is dict:
+                for key, value in items:
+                    key, todo = self._shallow(key, factories)
+                    if todo is not None:
+                        stack.append((todo, depth + 1))
+                    value, todo = self._shallow(value, factories)
+                    if todo is not None:
+                        stack.append((todo, depth + 1))
+                    target[key] = value
+            else:
+                append = target.append
+                for item in items:
+                    item, todo = self._shallow(item, factories)
+                    if todo is not None:
+                        stack.append((todo, depth + 1))
+                    append(item)
+        return result
+
+    def _shallow(self, data, factories):
+        # Premarshal `data`, except the items of builtin containers.
+        # Return the result and, for containers, the (items, result) to
+        # fill in.
+        cls = type(data)
+        if cls in _builtin_types:
+            try:
+                factory = factories[cls]
+            except KeyError:
+                factory = factories[cls] = self._premarshallers.lookup(
+                    cls, (implementedBy(cls),))
+            if factory is None:
+                return data, None
+            if factory in self.dict_premarshallers:
+                result = {}
+                return result, (data.items(), result)
+            if factory in self.sequence_premarshallers:
+                result = []
+                return result, (data, result)
+            premarshaller = factory(data)
+        else:
+            premarshaller = self.interface(data, None)
+        if premarshaller is not None:
+            return premarshaller(), None
+        return data, None
+
+
 def premarshal(data):
     """Premarshal data before handing it to xmlrpclib for marhalling
 
@@ -257,7 +532,10 @@ def premarshal(data):
     without resorting to removeSecurityProxy.   This way, we can avoid
     inadvertently providing access to data that should be protected.
     """
-    premarshaller = IXMLRPCPremarshaller(data, alternate=None)
-    if premarshaller is not None:
-        return premarshaller()
-    return data
+    return _premarshal(data)
+
+
+_premarshal = Premarshal(
+    IXMLRPCPremarshaller,
+    (DictPreMarshaller,),
+    (ListPreMarshaller, TuplePreMarshaller))